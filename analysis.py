@@ -1,83 +1,123 @@
-import json
+import concurrent.futures
+import functools
 import os
 import re
-import uuid
+import subprocess
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 from google.cloud import videointelligence
-from google.protobuf.json_format import MessageToJson
 from tqdm import tqdm
 
-from playback_scraper import get_playback_heatmarkers
-from utils import check_category, ensure_coords, parse_id, seconds_to_string
+from catalog import find_video_info
+from dataset import AnnotationDataset
+from object_store import LocalObjectStore
+from playback_scraper import fetch_heatmarkers
+from proxies import build_proxies, proxy_profile
+from segments import split_video, stitch_segments
+from utils import check_category, ensure_coords, parse_id, seconds_to_string, track_id
+
+MAX_IN_FLIGHT = 8
+SERVICE_FEATURES = {
+    'label_detection': videointelligence.Feature.LABEL_DETECTION,
+    'frame_label_detection': videointelligence.Feature.LABEL_DETECTION,
+    'transcription': videointelligence.Feature.SPEECH_TRANSCRIPTION,
+    'object_tracking': videointelligence.Feature.OBJECT_TRACKING,
+    'shot_change_detection': videointelligence.Feature.SHOT_CHANGE_DETECTION,
+}
+LABEL_DETECTION_MODES = {'label_detection': 'SHOT_MODE', 'frame_label_detection': 'FRAME_MODE'}
+
+
+@functools.lru_cache(maxsize=None)
+def get_video_client() -> videointelligence.VideoIntelligenceServiceClient:
+    """Builds the Video Intelligence client on first use, with the service account key found in credentials/"""
+    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = next(Path('credentials').glob('*.json')).as_posix()
+    return videointelligence.VideoIntelligenceServiceClient()
 
-os.environ['GOOGLE_APPLICATION_CREDENTIALS'] =  next(Path('credentials').glob('*.json')).as_posix()
 
 class VideoIntelligenceRequest():
+    """
+    Annotation request for one video. The video is only read when the request is sent and is not kept afterwards,
+    and results are returned rather than stored, so an instance holds no large data between calls. With an
+    object_store, the video is uploaded there and the request carries its URI instead of the bytes.
+    """
 
-    def __init__(self, client, path: Path):
-        self.df = None
-        self.transcript = None
+    def __init__(self, client, path: Path, object_store: Optional[LocalObjectStore] = None):
         self.path = path
         self.id = re.findall(r'\[(.*?)\]', path.stem)[0]
         self.filename = path.stem
-        self.input_content = path.read_bytes()
         self.client = client
+        self.object_store = object_store
+        if object_store is not None and getattr(object_store, 'uri_scheme', 'gs') != 'gs' \
+                and isinstance(client, videointelligence.VideoIntelligenceServiceClient):
+            raise ValueError(f"The Video Intelligence API only reads gs:// URIs, not {object_store.uri_scheme}:// ones")
+
+    def video_input(self) -> dict:
+        """:return: the input part of the request, the video URI when using an object store, its bytes otherwise"""
+        if self.object_store is not None:
+            return {"input_uri": self.object_store.upload(self.path)}
+        return {"input_content": self.path.read_bytes()}
+
+    def submit(self, features: List[str], label_detection_mode: Optional[str] = None):
+        """
+        Starts a single annotation operation covering all the features, without waiting for it
+        :param features: services to annotate, keys of SERVICE_FEATURES
+        :param label_detection_mode: overrides the label detection mode implied by the features
+        :return: the long-running operation
+        """
+        api_features = list(dict.fromkeys(SERVICE_FEATURES[feature] for feature in features))
+        context = {}
+        label_modes = {LABEL_DETECTION_MODES[feature] for feature in features if feature in LABEL_DETECTION_MODES}
+        if label_modes:
+            # shot and frame labels come out of the same label detection run
+            mode = label_detection_mode or (label_modes.pop() if len(label_modes) == 1 else 'SHOT_AND_FRAME_MODE')
+            context['label_detection_config'] = videointelligence.LabelDetectionConfig(label_detection_mode=mode)
+        if 'transcription' in features:
+            context['speech_transcription_config'] = videointelligence.SpeechTranscriptionConfig(
+                language_code="en-US", max_alternatives=1, enable_automatic_punctuation=True,
+                enable_word_confidence=True)
+        request = {**self.video_input(), "features": api_features}
+        if context:
+            request["video_context"] = videointelligence.VideoContext(**context)
+        return self.client.annotate_video(request=request)
+
+    def annotate(self, features: List[str], label_detection_mode: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Uploads the video once and annotates all the features in the same request
+        :param features: services to annotate, e.g. ['label_detection', 'transcription']
+        :param label_detection_mode: overrides the label detection mode implied by the features
+        :return: dataframe of each feature
+        """
+        operation = self.submit(features, label_detection_mode)
+        # a request with several features may get its results split over several entries for the same video
+        annotation_results = operation.result(timeout=99999)._pb.annotation_results
+        results = {}
+        for feature in features:
+            results[feature] = SERVICE_PARSERS[feature](annotation_results, self.id)
+            results[feature].insert(0, 'id', self.id)
+        return results
 
     def label_detection(self, mode='SHOT_MODE') -> pd.DataFrame:
-        features = [videointelligence.Feature.LABEL_DETECTION]
-        config = videointelligence.LabelDetectionConfig(label_detection_mode=mode)
-        video_context = videointelligence.VideoContext(label_detection_config=config)
-        operation = self.client.annotate_video(
-            request={"input_content": self.input_content, "features": features, "video_context": video_context})
-        self.df = parse_label_data(json.loads(MessageToJson(operation.result()._pb)))
-        self.df.insert(0, 'id', self.id)
-        return self.df
+        return self.annotate(['label_detection'], mode)['label_detection']
 
     def frame_label_detection(self, mode='FRAME_MODE') -> pd.DataFrame:
-        features = [videointelligence.Feature.LABEL_DETECTION]
-        config = videointelligence.LabelDetectionConfig(label_detection_mode=mode)
-        video_context = videointelligence.VideoContext(label_detection_config=config)
-        operation = self.client.annotate_video(
-            request={"input_content": self.input_content, "features": features, "video_context": video_context})
-        self.df = parse_frame_label_data(json.loads(MessageToJson(operation.result()._pb)))
-        self.df.insert(0, 'id', self.id)
-        return self.df
+        return self.annotate(['frame_label_detection'], mode)['frame_label_detection']
 
     def transcription(self) -> pd.DataFrame:
-        features = [videointelligence.Feature.SPEECH_TRANSCRIPTION]
-        config = videointelligence.SpeechTranscriptionConfig(
-            language_code="en-US", max_alternatives=1, enable_automatic_punctuation=True, enable_word_confidence=True)
-        video_context = videointelligence.VideoContext(speech_transcription_config=config)
-        operation = self.client.annotate_video(
-            request={"input_content": self.input_content, "features": features,
-                     "video_context": video_context})
-        self.df = parse_word_data(json.loads(MessageToJson(operation.result(timeout=99999)._pb)))
-        self.df.insert(0, 'id', self.id)
-        return self.df
+        return self.annotate(['transcription'])['transcription']
 
     def object_tracking(self) -> pd.DataFrame:
-        features = [videointelligence.Feature.OBJECT_TRACKING]
-        operation = self.client.annotate_video(
-            request={"input_content": self.input_content, "features": features})
-        self.df = parse_object_tracking_data(json.loads(MessageToJson(operation.result(timeout=99999)._pb)))
-        self.df.insert(0, 'id', self.id)
-        return self.df
+        return self.annotate(['object_tracking'])['object_tracking']
 
     def shot_change_detection(self) -> pd.DataFrame:
-        features = [videointelligence.Feature.SHOT_CHANGE_DETECTION]
-        operation = self.client.annotate_video(
-            request={"input_content": self.input_content, "features": features})
-        self.df = parse_shot_change_data(json.loads(MessageToJson(operation.result()._pb)))
-        self.df.insert(0, 'id', self.id)
-        return self.df
+        return self.annotate(['shot_change_detection'])['shot_change_detection']
 
 
 def parse_shot_change_data(data: dict) -> pd.DataFrame:
     annotations = []
-    data = data['annotationResults'][0]['shotAnnotations']
+    data = data['annotationResults'][0].get('shotAnnotations', [])
     for i, annotation in enumerate(data):
         shot_num = i
         start_sec = float(annotation['startTimeOffset'].strip('s'))
@@ -92,7 +132,7 @@ def parse_shot_change_data(data: dict) -> pd.DataFrame:
 def parse_label_data(_data: dict) -> pd.DataFrame:
     annotations = []
     data = _data['annotationResults'][0].get('shotLabelAnnotations') or _data['annotationResults'][0].get(
-        'frameLabelAnnotations')
+        'frameLabelAnnotations', [])
     for annotation in data:
         entity = annotation['entity']['description']
         category = check_category(annotation)
@@ -108,14 +148,13 @@ def parse_label_data(_data: dict) -> pd.DataFrame:
                         columns=['entity', 'category', 'start', 'end', 'start_sec', 'end_sec', 'confidence'])
 
 
-def parse_frame_label_data(_data: dict) -> pd.DataFrame:
+def parse_frame_label_data(_data: dict, video_id: str) -> pd.DataFrame:
     annotations = []
-    data = _data['annotationResults'][0]['frameLabelAnnotations']
-    for annotation in data:
-        entity_id = str(uuid.uuid4()).split('-')[0]
-        while entity_id in [x[0] for x in annotations]:
-            entity_id = str(uuid.uuid4()).split('-')[0]
+    data = _data['annotationResults'][0].get('frameLabelAnnotations', [])
+    taken = set()
+    for index, annotation in enumerate(data):
         entity = annotation['entity']['description']
+        entity_id = track_id(video_id, entity, index, taken)
         category = check_category(annotation)
         for item in annotation['frames']:
             time_sec = float(item['timeOffset'].strip('s'))
@@ -128,7 +167,7 @@ def parse_frame_label_data(_data: dict) -> pd.DataFrame:
 
 def parse_word_data(_data: dict) -> pd.DataFrame:
     words = []
-    data = _data['annotationResults'][0]['speechTranscriptions']
+    data = _data['annotationResults'][0].get('speechTranscriptions', [])
     transcriptions = [transcription for transcription in data if transcription['alternatives'][0].get('words')]
     for transcription in transcriptions:
         for word in transcription['alternatives'][0].get('words'):
@@ -142,19 +181,19 @@ def parse_word_data(_data: dict) -> pd.DataFrame:
     return pd.DataFrame(words, columns=['word', 'start', 'end', 'start_sec', 'end_sec', 'confidence'])
 
 
-def parse_object_tracking_data(data: dict) -> pd.DataFrame:
+def parse_object_tracking_data(data: dict, video_id: str) -> pd.DataFrame:
     """
     Parses the object tracking data from the Video Intelligence API
     :param data: data returned from the Video Intelligence API
+    :param video_id: id of the annotated video, object ids are derived from it
     :return: dataframe of object tracking data
     """
     objects = []
-    data = data['annotationResults'][0]['objectAnnotations']
-    for item in data:
-        object_id = str(uuid.uuid4()).split('-')[0]
-        while object_id in [x[0] for x in objects]:
-            object_id = str(uuid.uuid4()).split('-')[0]
+    data = data['annotationResults'][0].get('objectAnnotations', [])
+    taken = set()
+    for index, item in enumerate(data):
         object_name = item['entity']['description']
+        object_id = track_id(video_id, object_name, index, taken)
         for frame in item['frames']:
             # sometimes one of the coordinates is missing, sometimes they're even negative. Not sure what that means.
             bbox = frame.get('normalizedBoundingBox')
@@ -175,50 +214,260 @@ def parse_transcript_data(_data: dict) -> str:
     return ''.join(transcript)
 
 
-def batch_annotate_from_ids(ids: List[str], service: str, project_directory: Path) -> pd.DataFrame:
+def duration_seconds(duration) -> float:
+    """:param duration: protobuf Duration, as found in the time offsets of the annotation results"""
+    # one division of the exact nanosecond count gives the same float as parsing the "1.36s" json string
+    return (duration.seconds * 10 ** 9 + duration.nanos) / 1e9
+
+
+def category_string(annotation) -> str:
+    """Same as check_category, for a protobuf label annotation"""
+    return ','.join(entity.description for entity in annotation.category_entities) or 'n/a'
+
+
+def time_strings(seconds: np.ndarray) -> np.ndarray:
+    return np.array([seconds_to_string(t) for t in seconds], dtype=object)
+
+
+# The parse_*_results functions read the protobuf annotation results as returned by the API, without going
+# through json, and fill preallocated typed columns. Their output is the same as the parse_*_data ones.
+
+def parse_shot_change_results(results, video_id: str) -> pd.DataFrame:
+    """
+    :param results: annotation results of one video, VideoAnnotationResults protobuf messages
+    :param video_id: id of the video, the parsers that give ids to tracks derive them from it
+    :return: dataframe of shots
+    """
+    shots = [shot for result in results for shot in result.shot_annotations]
+    start_sec = np.fromiter((duration_seconds(shot.start_time_offset) for shot in shots), float, len(shots))
+    end_sec = np.fromiter((duration_seconds(shot.end_time_offset) for shot in shots), float, len(shots))
+    return pd.DataFrame({'shot_num': np.arange(len(shots)), 'start': time_strings(start_sec),
+                         'end': time_strings(end_sec), 'start_sec': start_sec, 'end_sec': end_sec})
+
+
+def parse_label_results(results, video_id: str) -> pd.DataFrame:
+    annotations = [annotation for result in results for annotation in result.shot_label_annotations] or \
+                  [annotation for result in results for annotation in result.frame_label_annotations]
+    size = sum(len(annotation.segments) for annotation in annotations)
+    entity, category = np.empty(size, dtype=object), np.empty(size, dtype=object)
+    start_sec, end_sec = np.empty(size), np.empty(size)
+    confidence = np.empty(size, dtype=np.float32)
+    i = 0
+    for annotation in annotations:
+        description, annotation_category = annotation.entity.description, category_string(annotation)
+        for item in annotation.segments:
+            entity[i], category[i] = description, annotation_category
+            start_sec[i] = duration_seconds(item.segment.start_time_offset)
+            end_sec[i] = duration_seconds(item.segment.end_time_offset)
+            confidence[i] = item.confidence
+            i += 1
+
+    return pd.DataFrame({'entity': entity, 'category': category, 'start': time_strings(start_sec),
+                         'end': time_strings(end_sec), 'start_sec': start_sec, 'end_sec': end_sec,
+                         'confidence': confidence})
+
+
+def parse_frame_label_results(results, video_id: str) -> pd.DataFrame:
+    annotations = [annotation for result in results for annotation in result.frame_label_annotations]
+    size = sum(len(annotation.frames) for annotation in annotations)
+    entity_id, entity, category = (np.empty(size, dtype=object) for _ in range(3))
+    time_sec = np.empty(size)
+    confidence = np.empty(size, dtype=np.float32)
+    taken = set()
+    i = 0
+    for index, annotation in enumerate(annotations):
+        description, annotation_category = annotation.entity.description, category_string(annotation)
+        annotation_id = track_id(video_id, description, index, taken)
+        for item in annotation.frames:
+            entity_id[i], entity[i], category[i] = annotation_id, description, annotation_category
+            time_sec[i] = duration_seconds(item.time_offset)
+            confidence[i] = item.confidence
+            i += 1
+
+    return pd.DataFrame({'entity_id': entity_id, 'entity': entity, 'category': category,
+                         'time': time_strings(time_sec), 'time_sec': time_sec, 'confidence': confidence})
+
+
+def parse_word_results(results, video_id: str) -> pd.DataFrame:
+    alternatives = [transcription.alternatives[0] for result in results
+                    for transcription in result.speech_transcriptions
+                    if transcription.alternatives and transcription.alternatives[0].words]
+    size = sum(len(alternative.words) for alternative in alternatives)
+    word = np.empty(size, dtype=object)
+    start_sec, end_sec = np.empty(size), np.empty(size)
+    confidence = np.empty(size, dtype=np.float32)
+    i = 0
+    for alternative in alternatives:
+        for item in alternative.words:
+            word[i] = item.word
+            start_sec[i] = duration_seconds(item.start_time)
+            end_sec[i] = duration_seconds(item.end_time)
+            confidence[i] = item.confidence
+            i += 1
+
+    return pd.DataFrame({'word': word, 'start': time_strings(start_sec), 'end': time_strings(end_sec),
+                         'start_sec': start_sec, 'end_sec': end_sec, 'confidence': confidence})
+
+
+def parse_object_tracking_results(results, video_id: str) -> pd.DataFrame:
+    """
+    Parses the object tracking results of the Video Intelligence API
+    :param results: annotation results of one video, VideoAnnotationResults protobuf messages
+    :param video_id: id of the annotated video, object ids are derived from it
+    :return: dataframe of object tracking data
+    """
+    annotations = [annotation for result in results for annotation in result.object_annotations]
+    size = sum(len(annotation.frames) for annotation in annotations)
+    object_id, object_name = np.empty(size, dtype=object), np.empty(size, dtype=object)
+    time_seconds = np.empty(size)
+    boxes = np.empty((size, 4), dtype=np.float32)
+    taken = set()
+    i = 0
+    for index, annotation in enumerate(annotations):
+        description = annotation.entity.description
+        annotation_id = track_id(video_id, description, index, taken)
+        for frame in annotation.frames:
+            bbox = frame.normalized_bounding_box
+            object_id[i], object_name[i] = annotation_id, description
+            time_seconds[i] = duration_seconds(frame.time_offset)
+            boxes[i] = bbox.left, bbox.top, bbox.right, bbox.bottom
+            i += 1
+    # same clamping as ensure_coords, missing coordinates are already 0 in protobuf
+    boxes[:, :2] = np.maximum(boxes[:, :2], 0)
+    boxes[:, 2:] = np.minimum(boxes[:, 2:], 1)
+
+    return pd.DataFrame({'object_id': object_id, 'object_name': object_name, 'time_seconds': time_seconds,
+                         'left': boxes[:, 0], 'top': boxes[:, 1], 'right': boxes[:, 2], 'bottom': boxes[:, 3]})
+
+
+SERVICE_PARSERS = {
+    'label_detection': parse_label_results,
+    'frame_label_detection': parse_frame_label_results,
+    'transcription': parse_word_results,
+    'object_tracking': parse_object_tracking_results,
+    'shot_change_detection': parse_shot_change_results,
+}
+
+
+def annotate_file(video_client, path: Path, features: List[str],
+                  object_store: Optional[LocalObjectStore] = None) -> Dict[str, pd.DataFrame]:
+    """Submits one request for all the features of a video or segment and waits for the operation"""
+    return VideoIntelligenceRequest(video_client, path, object_store).annotate(features)
+
+
+def batch_annotate_features(ids: List[str], features: List[str], project_directory: Path,
+                            max_in_flight: int = MAX_IN_FLIGHT, object_store: Optional[LocalObjectStore] = None,
+                            video_client=None, use_proxies: bool = False,
+                            segment_seconds: Optional[float] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Annotates all videos which ids are provided with several features at once. Every video is uploaded a single
+    time, for the features it has no annotations for yet. Up to max_in_flight operations run on the server at the
+    same time, the partitions of a video are added to the data/<feature> datasets as soon as its operation completes
+    :param project_directory: main directory of the project
+    :param ids: list of ids to annotate
+    :param features: services to use for annotation
+    :param max_in_flight: number of operations submitted and polled concurrently, 1 annotates one video at a time
+    :param object_store: when given, videos are uploaded there and requests pass their URI instead of their bytes
+    :param video_client: client to send the requests with, defaults to the Video Intelligence client
+    :param use_proxies: upload transcoded proxies instead of the originals, audio only when the only feature is
+    transcription and low resolution video otherwise. Proxies are cached in the proxies folder of the project
+    :param segment_seconds: when given, videos longer than one and a half segments are cut into overlapping
+    segments of about this length, annotated concurrently like separate videos and stitched back together
+    :return: dataframe with the annotations of each feature
+    """
+    original_videos_dir = project_directory / 'download'
+    datasets = {feature: AnnotationDataset(project_directory / 'data' / feature) for feature in features}
+    for dataset in datasets.values():
+        dataset.directory.mkdir(parents=True, exist_ok=True)
+    video_files = [path for path in original_videos_dir.glob('*.mp4') if parse_id(path.as_posix()) in ids]
+    video_client = video_client or get_video_client()
+
+    pending = {}
+    for path in video_files:
+        missing = {feature: dataset for feature, dataset in datasets.items() if not dataset.has(parse_id(path.stem))}
+        if missing:
+            pending[path] = missing
+
+    upload_paths = {path: path for path in pending}
+    if use_proxies:
+        upload_paths = build_proxies({path: proxy_profile(missing) for path, missing in pending.items()},
+                                     project_directory / 'proxies')
+
+    segments = {}
+    if segment_seconds:
+        durations = {path: find_video_info(upload_paths[path])['duration'] for path in pending}
+        for path in tqdm([path for path in pending if durations[path] > segment_seconds * 1.5],
+                         desc='Splitting long videos'):
+            try:
+                segments[path] = split_video(upload_paths[path], project_directory / 'segments' / path.stem,
+                                             durations[path], segment_seconds)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"Error splitting {path.name}, annotating it whole: {e}")
+
+    jobs = [(path, None, upload_paths[path]) for path in pending if path not in segments]
+    jobs += [(path, segment, segment.path) for path, video_segments in segments.items() for segment in video_segments]
+    segment_results = {path: {} for path in segments}
+    failed = set()
+
+    with tqdm(total=len(video_files), initial=len(video_files) - len(pending),
+              desc=f"Getting {', '.join(features)} data for videos in {Path(project_directory).name}") as progress, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = {executor.submit(annotate_file, video_client, upload_path, list(pending[path]), object_store):
+                   (path, segment) for path, segment, upload_path in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            path, segment = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                name = segment.path.name if segment is not None else path.name
+                print(f"Error getting {', '.join(pending[path])} data for {name}: {e}")
+                failed.add(path)
+                results = None
+            if segment is not None:
+                # a split video is written once all of its segments are back
+                segment_results[path][segment.index] = results
+                if len(segment_results[path]) < len(segments[path]):
+                    continue
+                results = None if path in failed else stitch_segments(parse_id(path.stem), segments[path],
+                                                                       segment_results.pop(path))
+            if results is not None:
+                for feature, data in results.items():
+                    pending[path][feature].write(parse_id(path.stem), path.stem, data)
+            progress.update()
+
+    return {feature: dataset.read(ids) for feature, dataset in datasets.items()}
+
+
+def batch_annotate_from_ids(ids: List[str], service: str, project_directory: Path,
+                            max_in_flight: int = MAX_IN_FLIGHT, object_store: Optional[LocalObjectStore] = None,
+                            video_client=None, use_proxies: bool = False,
+                            segment_seconds: Optional[float] = None) -> pd.DataFrame:
     """
     Annotates all videos which ids are provided and returns a dataframe with the annotations
     :param project_directory: main directory of the project
     :param ids: list of ids to annotate
     :param service: service to use for annotation
+    :param max_in_flight: number of operations submitted and polled concurrently, 1 annotates one video at a time
+    :param object_store: when given, videos are uploaded there and requests pass their URI instead of their bytes
+    :param video_client: client to send the requests with, defaults to the Video Intelligence client
+    :param use_proxies: upload a transcoded proxy of each video instead of the original
+    :param segment_seconds: when given, long videos are annotated in segments of about this length in parallel
     :return: dataframe with annotations
     """
-    original_videos_dir = project_directory / 'download'
-    out_dir = project_directory / 'data' / service
-    out_dir.mkdir(parents=True, exist_ok=True)
-    video_files = [path for path in original_videos_dir.glob('*.mp4') if parse_id(path.as_posix()) in ids]
-    video_client = videointelligence.VideoIntelligenceServiceClient()
-    
-    for path in tqdm(video_files, desc=f"Getting {service} data for videos in {Path(project_directory).name}"):
-        csv_path = Path(out_dir, f'{path.stem}.csv').resolve()
-        if csv_path.is_file():
-            continue
-        r = VideoIntelligenceRequest(video_client, path)
-        data = getattr(r, service)()
-        data.to_csv(csv_path, index=False)
-
-    merged_df = pd.concat(
-        [pd.read_csv(path.resolve().as_posix()) for path in out_dir.glob('*.csv') if parse_id(path.stem) in ids])
-    merged_df.to_csv(Path(out_dir, 'merged.csv').resolve(), index=False)
-    return merged_df
+    return batch_annotate_features(ids, [service], project_directory, max_in_flight, object_store,
+                                   video_client, use_proxies, segment_seconds)[service]
 
 
 def most_replayed(video_ids: List, project_dir: Path) -> None:
     """
-    Finds the most replayed parts of the videos and saves them to a csv file
+    Finds the most replayed parts of the videos and saves them to the playback dataset, a csv partition per video
     :param video_ids: List of YouTube video ids
-    :param project_dir: Directory where the output csv file will be saved
-    :return: saves a csv file with the most replayed parts of the videos
+    :param project_dir: main directory of the project
+    :return: saves a csv file with the most replayed parts of each video
     """
-    playback_data_dir = project_dir / 'data' / 'playback'
-    playback_data_dir.mkdir(parents=True, exist_ok=True)
-    video_heatmarkers = {}
-    for video_id in tqdm(video_ids, desc='Getting playback data'):
-        heatmarkers = get_playback_heatmarkers(video_id)
+    dataset = AnnotationDataset(project_dir / 'data' / 'playback')
+    dataset.directory.mkdir(parents=True, exist_ok=True)
+    for video_id, heatmarkers in tqdm(fetch_heatmarkers(video_ids), total=len(video_ids),
+                                      desc='Getting playback data'):
         if heatmarkers is not None:
-            video_heatmarkers[video_id] = heatmarkers
-            heatmarkers.to_csv(Path(playback_data_dir, f'{video_id}.csv').resolve(), index=False)
-    
-    if video_heatmarkers:
-        merged_heatmarkers = pd.concat(video_heatmarkers.values())
-        merged_heatmarkers.to_csv(Path(playback_data_dir, 'merged.csv').resolve(), index=False)
+            dataset.write(video_id, video_id, heatmarkers)
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+CACHE_PATH = Path.home() / 'mismas' / 'api_cache.sqlite'
+TTL_CONFIG_PATH = Path.home() / 'mismas' / 'api_cache_ttl.json'
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Time to live in seconds for each part of a resource, and for whole cached responses (playlist pages, searches).
+# Metadata such as titles and durations rarely changes, counters change all the time.
+DEFAULT_TTL = {
+    'snippet': 7 * DAY,
+    'contentDetails': 30 * DAY,
+    'statistics': DAY,
+    'topicDetails': 30 * DAY,
+    'brandingSettings': 7 * DAY,
+    'contentOwnerDetails': 30 * DAY,
+    'playlistItems': 12 * HOUR,
+    'search': DAY,
+    'heatmarkers': DAY,
+    # videos found without heatmarkers, which may get them once they have enough views
+    'heatmarkers_missing': HOUR,
+}
+
+
+def load_ttl() -> Dict[str, float]:
+    """
+    Default TTLs, overridden by the values found in ~/mismas/api_cache_ttl.json, e.g. {"statistics": 3600}
+    """
+    ttl = dict(DEFAULT_TTL)
+    if TTL_CONFIG_PATH.is_file():
+        with open(TTL_CONFIG_PATH, encoding='utf8') as f:
+            ttl.update(json.load(f))
+    return ttl
+
+
+class ApiCache:
+    """
+    SQLite cache of YouTube Data API responses. Resources are stored one part at a time, keyed by
+    (kind, resource id, part), so each part expires according to its own TTL and only stale parts are refreshed.
+    Paged and search responses are stored whole, keyed by their request parameters.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, ttl: Optional[Dict[str, float]] = None):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = load_ttl() if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path.as_posix(), check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS parts (kind TEXT, resource_id TEXT, part TEXT, etag TEXT, '
+                             'fetched_at REAL, body TEXT, PRIMARY KEY (kind, resource_id, part))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, etag TEXT, '
+                             'fetched_at REAL, body TEXT)')
+
+    def is_fresh(self, ttl_key: str, fetched_at: float) -> bool:
+        return time.time() - fetched_at < self.ttl.get(ttl_key, 0)
+
+    def get_parts(self, kind: str, ids: List[str], parts: List[str]) -> Tuple[Dict[str, dict], Dict[str, Set[str]]]:
+        """
+        Looks up the requested parts of the given resources
+        :param kind: resource kind, e.g. 'videos' or 'channels'
+        :param ids: resource ids
+        :param parts: parts to look up, e.g. ['snippet', 'statistics']
+        :return: resources assembled from the fresh parts found, and the parts to refresh for each resource id
+        """
+        items, stale = {}, {}
+        with self._lock:
+            rows = self._db.execute(
+                f'SELECT resource_id, part, fetched_at, body FROM parts WHERE kind = ? '
+                f'AND resource_id IN ({",".join("?" * len(ids))}) AND part IN ({",".join("?" * len(parts))})',
+                [kind, *ids, *parts]).fetchall()
+        found = {(resource_id, part): (fetched_at, body) for resource_id, part, fetched_at, body in rows}
+        for resource_id in ids:
+            for part in parts:
+                fetched_at, body = found.get((resource_id, part), (None, None))
+                if fetched_at is None or not self.is_fresh(part, fetched_at):
+                    stale.setdefault(resource_id, set()).add(part)
+                    continue
+                item = items.setdefault(resource_id, {'id': resource_id})
+                body = json.loads(body)
+                if body is not None:
+                    item[part] = body
+        return items, stale
+
+    def put_item(self, kind: str, item: dict, parts: List[str]) -> None:
+        """
+        Stores the given parts of a resource. Parts whose ETag did not change since the last fetch only have
+        their timestamp refreshed
+        """
+        now = time.time()
+        with self._lock, self._db:
+            for part in parts:
+                row = self._db.execute('SELECT etag FROM parts WHERE kind = ? AND resource_id = ? AND part = ?',
+                                       (kind, item['id'], part)).fetchone()
+                if row is not None and row[0] == item.get('etag'):
+                    self._db.execute('UPDATE parts SET fetched_at = ? WHERE kind = ? AND resource_id = ? AND part = ?',
+                                     (now, kind, item['id'], part))
+                else:
+                    self._db.execute('INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?, ?, ?)',
+                                     (kind, item['id'], part, item.get('etag'), now, json.dumps(item.get(part))))
+
+    def get_response(self, key: str, ttl_key: str) -> Tuple[Optional[dict], Optional[str], bool]:
+        """
+        :param key: key of the cached response
+        :param ttl_key: key of the TTL to apply
+        :return: cached body, its ETag and whether it is still fresh
+        """
+        with self._lock:
+            row = self._db.execute('SELECT etag, fetched_at, body FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None, None, False
+        etag, fetched_at, body = row
+        return json.loads(body), etag, self.is_fresh(ttl_key, fetched_at)
+
+    def put_response(self, key: str, body: dict) -> None:
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                             (key, body.get('etag'), time.time(), json.dumps(body)))
+
+    def touch_response(self, key: str) -> None:
+        with self._lock, self._db:
+            self._db.execute('UPDATE responses SET fetched_at = ? WHERE key = ?', (time.time(), key))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_api_cache() -> ApiCache:
+    """Returns the cache shared by the whole process, creating it on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ApiCache()
+    return _cache
@@ -0,0 +1,84 @@
+"""
+End-to-end benchmark of the analysis path against the offline Video Intelligence stand-in: runs
+batch_annotate_features over synthetic videos and reports throughput, parse time and peak memory.
+
+    python benchmarks/annotate_pipeline.py --videos 100 --features object_tracking transcription
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+import analysis
+from dataset import AnnotationDataset
+from fake_video_intelligence import FakeVideoIntelligenceClient, load_responses
+
+
+def make_videos(download_dir: Path, count: int, size: int) -> list:
+    """Writes count files of random bytes named like downloaded videos, :return: their ids"""
+    download_dir.mkdir(parents=True)
+    ids = [f'synth{i:06d}' for i in range(count)]
+    for video_id in ids:
+        (download_dir / f'[{video_id}]_synthetic.mp4').write_bytes(os.urandom(size))
+    return ids
+
+
+def time_parsers() -> dict:
+    """Wraps the parsers used by the pipeline so that the time spent in them is added up"""
+    totals = {'seconds': 0.0, 'calls': 0}
+    lock = threading.Lock()
+
+    def timed(parser):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return parser(*args, **kwargs)
+            finally:
+                with lock:
+                    totals['seconds'] += time.perf_counter() - start
+                    totals['calls'] += 1
+        return wrapper
+
+    for feature, parser in list(analysis.SERVICE_PARSERS.items()):
+        analysis.SERVICE_PARSERS[feature] = timed(parser)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--videos', type=int, default=50)
+    parser.add_argument('--video-size', type=float, default=2.0, help='size of each synthetic video in MB')
+    parser.add_argument('--features', nargs='+', default=['object_tracking'], choices=list(analysis.SERVICE_FEATURES))
+    parser.add_argument('--latency', type=float, nargs=2, default=(1.0, 3.0), metavar=('MIN', 'MAX'))
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--max-in-flight', type=int, default=analysis.MAX_IN_FLIGHT)
+    parser.add_argument('--responses', type=Path, help='directory of recorded responses saved as json')
+    args = parser.parse_args()
+
+    client = FakeVideoIntelligenceClient(load_responses(args.responses) if args.responses else None,
+                                         latency=tuple(args.latency), failure_rate=args.failure_rate, seed=0)
+    parse_totals = time_parsers()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        project_dir = Path(tmp)
+        ids = make_videos(project_dir / 'download', args.videos, int(args.video_size * 2 ** 20))
+        start = time.perf_counter()
+        analysis.batch_annotate_features(ids, args.features, project_dir, args.max_in_flight, video_client=client)
+        elapsed = time.perf_counter() - start
+        annotated = min(len(AnnotationDataset(project_dir / 'data' / feature).ids()) for feature in args.features)
+
+    print(f"videos annotated:  {annotated}/{args.videos} in {elapsed:.1f}s, {annotated / elapsed * 60:.1f} per minute")
+    print(f"requests:          {client.requests}, at most {client.max_in_flight} in flight, "
+          f"{client.bytes_sent / 2 ** 20:.0f} MB sent")
+    print(f"parse time:        {parse_totals['seconds']:.2f}s over {parse_totals['calls']} results")
+    print(f"peak memory (RSS): {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Offline stand-in for videointelligence.VideoIntelligenceServiceClient. It replays recorded AnnotateVideoResponse
+protobufs, trimmed to the features of each request, after a configurable latency and with a configurable
+failure rate, so the analysis pipeline can be measured without calling the API.
+"""
+import random
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from google.api_core import exceptions
+from google.cloud import videointelligence
+from google.protobuf.json_format import Parse
+
+Feature = videointelligence.Feature
+FEATURE_FIELDS = {
+    Feature.LABEL_DETECTION: ['segment_label_annotations', 'shot_label_annotations', 'frame_label_annotations'],
+    Feature.SHOT_CHANGE_DETECTION: ['shot_annotations'],
+    Feature.SPEECH_TRANSCRIPTION: ['speech_transcriptions'],
+    Feature.OBJECT_TRACKING: ['object_annotations'],
+}
+
+
+def synthetic_response(objects: int = 20, frames: int = 100, shots: int = 30, labels: int = 40, words: int = 600,
+                       seed: int = 0):
+    """:return: AnnotateVideoResponse protobuf with results for every feature the pipeline uses"""
+    rng = np.random.default_rng(seed)
+    response = videointelligence.AnnotateVideoResponse()._pb
+    result = response.annotation_results.add()
+    for i in range(shots):
+        shot = result.shot_annotations.add()
+        shot.start_time_offset.FromMilliseconds(i * 4000)
+        shot.end_time_offset.FromMilliseconds(i * 4000 + 3960)
+    for i in range(labels):
+        shot_label = result.shot_label_annotations.add()
+        shot_label.entity.description = f'label {i}'
+        shot_label.category_entities.add().description = f'category {i % 5}'
+        segment = shot_label.segments.add()
+        segment.segment.start_time_offset.FromMilliseconds(i * 1000)
+        segment.segment.end_time_offset.FromMilliseconds(i * 1000 + 3000)
+        segment.confidence = rng.random()
+        frame_label = result.frame_label_annotations.add()
+        frame_label.entity.description = f'label {i}'
+        for j in range(5):
+            frame = frame_label.frames.add()
+            frame.time_offset.FromMilliseconds(i * 1000 + j * 500)
+            frame.confidence = rng.random()
+    transcription = result.speech_transcriptions.add()
+    alternative = transcription.alternatives.add()
+    for i in range(words):
+        word = alternative.words.add()
+        word.word = f'word{i % 100}'
+        word.start_time.FromMilliseconds(i * 300)
+        word.end_time.FromMilliseconds(i * 300 + 250)
+        word.confidence = rng.random()
+    for i in range(objects):
+        annotation = result.object_annotations.add()
+        annotation.entity.description = f'object {i % 10}'
+        for j in range(frames):
+            frame = annotation.frames.add()
+            frame.time_offset.FromMilliseconds(i * 1000 + j * 100)
+            left, top = rng.random(2) * 0.8
+            box = frame.normalized_bounding_box
+            box.left, box.top, box.right, box.bottom = left, top, left + 0.2, top + 0.2
+    return response
+
+
+def load_responses(directory: Path) -> list:
+    """:return: AnnotateVideoResponse protobufs of the json files in a directory, saved with MessageToJson"""
+    return [Parse(path.read_text(), videointelligence.AnnotateVideoResponse()._pb)
+            for path in sorted(directory.glob('*.json'))]
+
+
+class FakeOperation:
+    """Long-running operation that completes at a set time, with a response or with an error"""
+
+    def __init__(self, response, ready_at: float, error: Optional[Exception] = None):
+        self._response = response
+        self._ready_at = ready_at
+        self._error = error
+
+    def done(self) -> bool:
+        return time.monotonic() >= self._ready_at
+
+    def result(self, timeout: Optional[float] = None):
+        delay = self._ready_at - time.monotonic()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise exceptions.DeadlineExceeded('Operation did not complete within the timeout')
+        if delay > 0:
+            time.sleep(delay)
+        if self._error is not None:
+            raise self._error
+        return videointelligence.AnnotateVideoResponse.wrap(self._response)
+
+
+class FakeVideoIntelligenceClient:
+    """
+    Drop-in replacement for VideoIntelligenceServiceClient.annotate_video. Every request gets one of the recorded
+    responses, in turn, keeping only the results of the requested features. Keeps counters of the requests,
+    of the bytes sent inline and of the highest number of operations in flight.
+    """
+
+    def __init__(self, responses: Optional[list] = None, latency: Tuple[float, float] = (1.0, 3.0),
+                 failure_rate: float = 0.0, seed: Optional[int] = None):
+        """
+        :param responses: AnnotateVideoResponse protobufs to replay, a synthetic one by default
+        :param latency: bounds of the uniformly distributed processing time of an operation in seconds
+        :param failure_rate: fraction of operations that fail with ServiceUnavailable
+        """
+        self.responses = responses or [synthetic_response()]
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.bytes_sent = 0
+        self.max_in_flight = 0
+        self._operations: List[FakeOperation] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def annotate_video(self, request: dict) -> FakeOperation:
+        features = set(request['features'])
+        with self._lock:
+            response = videointelligence.AnnotateVideoResponse()._pb
+            response.CopyFrom(self.responses[self.requests % len(self.responses)])
+            self.requests += 1
+            self.bytes_sent += len(request.get('input_content', b''))
+            ready_at = time.monotonic() + self._random.uniform(*self.latency)
+            fails = self._random.random() < self.failure_rate
+            self._operations = [operation for operation in self._operations if not operation.done()]
+            self.max_in_flight = max(self.max_in_flight, len(self._operations) + 1)
+
+        for result in response.annotation_results:
+            for feature, fields in FEATURE_FIELDS.items():
+                if feature not in features:
+                    for field in fields:
+                        result.ClearField(field)
+        error = exceptions.ServiceUnavailable('Fake service failure') if fails else None
+        operation = FakeOperation(response, ready_at, error)
+        with self._lock:
+            self._operations.append(operation)
+        return operation
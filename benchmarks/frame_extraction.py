@@ -0,0 +1,56 @@
+"""
+Compares reading frames with frame_reader against one ffmpeg seek per timestamp, as extract_frame used to do.
+
+    python benchmarks/frame_extraction.py video.mp4 [--fps 20] [--seconds 30]
+
+Frames are read at --fps over the first --seconds of the video and kept in memory in both cases.
+"""
+import argparse
+import concurrent.futures
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+import numpy as np
+
+from catalog import find_video_info
+from frame_reader import read_frames
+
+
+def seek_frame(path: Path, timestamp: float, width: int, height: int) -> np.ndarray:
+    output = subprocess.run(['ffmpeg', '-v', 'error', '-ss', str(timestamp), '-i', path.as_posix(), '-frames:v', '1',
+                             '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'], stdout=subprocess.PIPE, check=True)
+    return np.frombuffer(output.stdout, np.uint8).reshape(height, width, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video', type=Path)
+    parser.add_argument('--fps', type=float, default=20)
+    parser.add_argument('--seconds', type=float, default=30)
+    args = parser.parse_args()
+
+    info = find_video_info(args.video)
+    timestamps = np.arange(0, min(args.seconds, info['duration']), 1 / args.fps)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        seeked = list(executor.map(lambda t: seek_frame(args.video, t, info['width'], info['height']), timestamps))
+    seek_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frames = list(read_frames(args.video, timestamps))
+    read_time = time.perf_counter() - start
+
+    difference = np.mean([np.abs(a.astype(np.int16) - b).mean() for a, (_, b) in zip(seeked, frames)])
+    print(f"{len(timestamps)} frames of {args.video.name}")
+    print(f"one seek per frame: {seek_time:6.2f}s")
+    print(f"frame_reader:       {read_time:6.2f}s  {seek_time / read_time:.1f}x, "
+          f"mean pixel difference {difference:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Compares the ytInitialData extraction of playback_scraper with the previous BeautifulSoup parsing.
+
+    python benchmarks/heatmarker_parse.py saved_pages/*.html [--repeat 20]
+
+Without saved watch pages, a synthetic page of about 1 MB is used.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+from bs4 import BeautifulSoup
+
+import playback_scraper
+
+
+def legacy_parse(html: str) -> list:
+    """The previous parser: builds the whole HTML tree and decodes the whole ytInitialData"""
+    for script in BeautifulSoup(html, 'html.parser').find_all('script'):
+        if script.text.startswith('var ytInitialData'):
+            response_dict = json.loads(re.sub(r'^.*?{', '{', script.text).replace(';', ''))
+            return response_dict['playerOverlays']['playerOverlayRenderer']['decoratedPlayerBarRenderer'][
+                'decoratedPlayerBarRenderer']['playerBar']['multiMarkersPlayerBarRenderer']['markersMap'][-1][
+                'value']['heatmap']['heatmapRenderer']['heatMarkers']
+    return []
+
+
+def synthetic_page() -> str:
+    markers = [{'heatMarkerRenderer': {'timeRangeStartMillis': i * 6000, 'markerDurationMillis': 6000,
+                                       'heatMarkerIntensityScoreNormalized': i / 100}} for i in range(100)]
+    initial_data = {
+        'contents': {'items': [{'videoRenderer': {'title': f'related video {i}', 'description': 'x' * 400}}
+                               for i in range(2000)]},
+        'playerOverlays': {'playerOverlayRenderer': {'decoratedPlayerBarRenderer': {'decoratedPlayerBarRenderer': {
+            'playerBar': {'multiMarkersPlayerBarRenderer': {'markersMap': [
+                {'key': 'HEATSEEKER', 'value': {'heatmap': {'heatmapRenderer': {'heatMarkers': markers}}}}]}}}}}},
+    }
+    scripts = ''.join(f'<script>var config{i} = {{"value": {i}}};</script>' for i in range(50))
+    return (f'<html><head><title>page</title>{scripts}</head><body><div>{"<p>text</p>" * 2000}</div>'
+            f'<script>var ytInitialData = {json.dumps(initial_data)};</script></body></html>')
+
+
+def best_time(fn, html: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pages', nargs='*', type=Path)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    pages = {path.name: path.read_text(encoding='utf8') for path in args.pages} or {'synthetic': synthetic_page()}
+    for name, html in pages.items():
+        new = playback_scraper.parse_heatmarkers(name, html)
+        legacy = best_time(legacy_parse, html, args.repeat)
+        targeted = best_time(lambda page: playback_scraper.parse_heatmarkers(name, page), html, args.repeat)
+        markers = 0 if new is None else len(new)
+        print(f"{name[:40]:40} {len(html) / 2 ** 20:5.1f} MB  {markers:4} markers  "
+              f"BeautifulSoup {legacy * 1000:8.2f} ms  ytInitialData {targeted * 1000:7.2f} ms  "
+              f"{legacy / targeted:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
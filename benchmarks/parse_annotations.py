@@ -0,0 +1,83 @@
+"""
+Compares the protobuf parsers of analysis.py with the json based ones on an object tracking response.
+
+    python benchmarks/parse_annotations.py [recorded_response.json] [--objects N] [--frames N]
+
+A recorded response is an AnnotateVideoResponse saved with MessageToJson. Without one, a synthetic response
+with the given number of objects and frames per object is used.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+import numpy as np
+from google.cloud import videointelligence
+from google.protobuf.json_format import MessageToJson, Parse
+
+import analysis
+
+
+def synthetic_response(objects: int, frames: int) -> videointelligence.AnnotateVideoResponse:
+    rng = np.random.default_rng(0)
+    response = videointelligence.AnnotateVideoResponse()._pb
+    result = response.annotation_results.add()
+    for i in range(objects):
+        annotation = result.object_annotations.add()
+        annotation.entity.description = f'object {i % 50}'
+        annotation.confidence = rng.random()
+        for j in range(frames):
+            frame = annotation.frames.add()
+            frame.time_offset.FromMilliseconds(i * 10 + j * 40)
+            left, top = rng.random(2) * 0.8
+            box = frame.normalized_bounding_box
+            box.left, box.top, box.right, box.bottom = left, top, left + 0.2, top + 0.2
+    return response
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def json_parse(response):
+    return analysis.parse_object_tracking_data(json.loads(MessageToJson(response)), 'benchmark')
+
+
+def protobuf_parse(response):
+    return analysis.parse_object_tracking_results(response.annotation_results, 'benchmark')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('response', nargs='?', type=Path)
+    parser.add_argument('--objects', type=int, default=500)
+    parser.add_argument('--frames', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.response:
+        response = Parse(args.response.read_text(), videointelligence.AnnotateVideoResponse()._pb)
+    else:
+        response = synthetic_response(args.objects, args.frames)
+
+    old, old_time, old_peak = measure(json_parse, response)
+    new, new_time, new_peak = measure(protobuf_parse, response)
+    columns = ['object_id', 'object_name', 'time_seconds', 'left', 'top', 'right', 'bottom']
+    same = old[columns].to_csv(index=False) == new[columns].to_csv(index=False)
+
+    print(f"{len(new)} rows, same output: {same}")
+    print(f"json round-trip: {old_time:8.3f}s  peak {old_peak / 2 ** 20:8.1f} MB")
+    print(f"protobuf:        {new_time:8.3f}s  peak {new_peak / 2 ** 20:8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares local shot detection with the Video Intelligence shot change detection on sample videos.
+
+    python benchmarks/shot_detection.py videos/*.mp4 [--cloud] [--tolerance 0.5]
+
+Video names must carry the id in brackets, as downloaded videos do. Without --cloud only the local backend runs;
+with it the cloud results are fetched too, which needs the credentials/ folder, and the cuts of the two backends
+are matched within the tolerance.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+import numpy as np
+
+import shot_detection
+
+
+def match_cuts(reference: np.ndarray, detected: np.ndarray, tolerance: float) -> int:
+    """:return: number of reference cuts with a detected cut within the tolerance"""
+    if not len(reference) or not len(detected):
+        return 0
+    return int((np.abs(reference[:, None] - detected[None, :]).min(axis=1) <= tolerance).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('videos', nargs='+', type=Path)
+    parser.add_argument('--cloud', action='store_true', help='also run the Video Intelligence shot detection')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='seconds between matching cuts')
+    args = parser.parse_args()
+
+    if args.cloud:
+        import analysis
+        client = analysis.get_video_client()
+
+    totals = {'local': 0.0, 'cloud': 0.0, 'matched': 0, 'cloud_cuts': 0, 'local_cuts': 0}
+    for path in args.videos:
+        start = time.perf_counter()
+        local = shot_detection.detect_shots(path)
+        local_time = time.perf_counter() - start
+        totals['local'] += local_time
+        line = f"{path.name[:40]:40}  local {len(local):4} shots {local_time:7.2f}s"
+
+        if args.cloud:
+            start = time.perf_counter()
+            cloud = analysis.VideoIntelligenceRequest(client, path).shot_change_detection()
+            cloud_time = time.perf_counter() - start
+            totals['cloud'] += cloud_time
+            local_cuts, cloud_cuts = local['start_sec'].to_numpy()[1:], cloud['start_sec'].to_numpy()[1:]
+            matched = match_cuts(cloud_cuts, local_cuts, args.tolerance)
+            totals['matched'] += matched
+            totals['cloud_cuts'] += len(cloud_cuts)
+            totals['local_cuts'] += len(local_cuts)
+            line += f"  cloud {len(cloud):4} shots {cloud_time:7.2f}s  matched cuts {matched}/{len(cloud_cuts)}"
+        print(line)
+
+    print(f"local total: {totals['local']:.1f}s")
+    if args.cloud:
+        recall = totals['matched'] / totals['cloud_cuts'] if totals['cloud_cuts'] else 1.0
+        precision = totals['matched'] / totals['local_cuts'] if totals['local_cuts'] else 1.0
+        print(f"cloud total: {totals['cloud']:.1f}s, local cuts recall {recall:.2f}, precision {precision:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import concurrent.futures
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+CATALOG_NAME = '.catalog.sqlite'
+COLUMNS = ['path', 'video_id', 'size', 'mtime', 'duration', 'width', 'height', 'fps', 'video_codec', 'audio_codec',
+           'keyframes']
+# -skip_frame nokey makes -count_frames count only keyframes, and only keyframes get decoded
+PROBE_COMMAND = ['ffprobe', '-v', 'error', '-skip_frame', 'nokey', '-count_frames', '-show_entries',
+                 'format=duration:stream=codec_type,codec_name,width,height,avg_frame_rate,nb_read_frames',
+                 '-of', 'json']
+
+
+def probe_video(path: Path) -> dict:
+    """
+    Runs a single ffprobe on a video
+    :return: duration, width, height, fps, codecs and keyframe count of the video
+    """
+    output = subprocess.run([*PROBE_COMMAND, path.as_posix()], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    probe = json.loads(output.stdout or '{}')
+    streams = probe.get('streams', [])
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), {})
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), {})
+    numerator, _, denominator = video.get('avg_frame_rate', '0/1').partition('/')
+    return {
+        'duration': float(probe.get('format', {}).get('duration', 0)),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'fps': float(numerator) / float(denominator) if float(denominator or 0) else None,
+        'video_codec': video.get('codec_name'),
+        'audio_codec': audio.get('codec_name'),
+        'keyframes': int(video['nb_read_frames']) if video.get('nb_read_frames', 'N/A').isdigit() else None,
+    }
+
+
+class VideoCatalog:
+    """
+    Catalog of the mp4 files in a directory, stored in a SQLite file inside it. Maps video ids to paths with a
+    single scan of the directory, and keeps the ffprobe metadata of every file, which is probed again only
+    when the size or modification time of the file changes.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.db_path = directory / CATALOG_NAME
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+        self._paths = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # connections must not be shared with forked worker processes
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.db_path.as_posix(), check_same_thread=False)
+            self._pid = os.getpid()
+            with self._db:
+                self._db.execute(f'CREATE TABLE IF NOT EXISTS videos ({", ".join(COLUMNS)}, PRIMARY KEY (path))')
+        return self._db
+
+    def scan(self) -> Dict[str, Path]:
+        self._paths = {}
+        for path in sorted(self.directory.glob('*.mp4')):
+            video_id = re.findall(r'\[(.*?)\]', path.name)
+            self._paths.setdefault(video_id[0] if video_id else path.stem, path)
+        return self._paths
+
+    def paths(self) -> Dict[str, Path]:
+        return self._paths if self._paths is not None else self.scan()
+
+    def path(self, video_id: str) -> Path:
+        """
+        :param video_id: video id
+        :return: path of the video, the directory is scanned again if the video is not known or moved
+        """
+        path = self.paths().get(video_id)
+        if path is None or not path.is_file():
+            path = self.scan().get(video_id)
+        if path is None:
+            # files not following the [id]_title.mp4 naming
+            path = next((path for path in self._paths.values() if video_id in path.name), None)
+        if path is None:
+            raise FileNotFoundError(f"No video with id {video_id} in {self.directory}")
+        return path
+
+    def info(self, path: Path) -> dict:
+        """
+        :param path: path of a video in the catalog directory
+        :return: catalog row of the video, probed if the file changed since it was last cataloged
+        """
+        stat = path.stat()
+        with self._lock:
+            row = self.db.execute(f'SELECT {", ".join(COLUMNS)} FROM videos WHERE path = ?', (path.name,)).fetchone()
+        if row is not None and row[2] == stat.st_size and row[3] == stat.st_mtime:
+            return dict(zip(COLUMNS, row))
+
+        video_id = re.findall(r'\[(.*?)\]', path.name)
+        info = {'path': path.name, 'video_id': video_id[0] if video_id else path.stem, 'size': stat.st_size,
+                'mtime': stat.st_mtime, **probe_video(path)}
+        with self._lock, self.db:
+            self.db.execute(f'INSERT OR REPLACE INTO videos VALUES ({", ".join("?" * len(COLUMNS))})',
+                            [info[column] for column in COLUMNS])
+        return info
+
+    def info_by_id(self, video_id: str) -> dict:
+        return self.info(self.path(video_id))
+
+    def all_info(self) -> List[dict]:
+        """Catalog rows of all the videos in the directory, probing the new or changed ones in parallel"""
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            return list(executor.map(self.info, self.scan().values()))
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(directory: Path) -> VideoCatalog:
+    """Returns the catalog of a directory, shared by the whole process"""
+    key = Path(directory).resolve()
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = VideoCatalog(key)
+        return _catalogs[key]
+
+
+def find_video_info(path: Path) -> dict:
+    """Catalog row of any video, cataloged in the directory that contains it"""
+    return get_catalog(path.parent).info(path)
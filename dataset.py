@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from utils import parse_id
+
+MANIFEST_NAME = 'manifest.jsonl'
+# written by older versions, every partition is already in the directory
+LEGACY_MERGED_NAME = 'merged.csv'
+
+
+class AnnotationDataset:
+    """
+    Annotations of one service, kept in data/<service> as one csv partition per video plus an append-only
+    manifest with a line per written partition. Adding a video writes its partition and appends one line, and
+    reading a selection of videos only opens their partitions.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._partitions = None
+
+    @property
+    def partitions(self) -> Dict[str, dict]:
+        """:return: manifest entry of each video, with the partition file name and its number of rows"""
+        if self._partitions is None:
+            self._partitions = self._load_manifest()
+        return self._partitions
+
+    def _load_manifest(self) -> Dict[str, dict]:
+        partitions = {}
+        if self.manifest_path.is_file():
+            with open(self.manifest_path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        partitions[entry['video_id']] = entry
+        partitions.update(self._index_existing(partitions))
+        return partitions
+
+    def _index_existing(self, partitions: Dict[str, dict]) -> Dict[str, dict]:
+        """
+        Adds to the manifest the csvs it does not know about, written before the manifest existed or without going
+        through the dataset
+        :param partitions: entries already in the manifest
+        :return: entries of the new csvs
+        """
+        known = {entry['file'] for entry in partitions.values()}
+        found = {}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob('*.csv')):
+            # playback data is named after the bare id
+            video_id = parse_id(path.stem) or path.stem
+            if video_id and path.name != LEGACY_MERGED_NAME and path.name not in known:
+                found[video_id] = {'video_id': video_id, 'file': path.name, 'rows': None,
+                                   'written': path.stat().st_mtime}
+        if found or not self.manifest_path.is_file():
+            with open(self.manifest_path, 'a') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in found.values())
+        return found
+
+    def partition_path(self, video_id: str) -> Optional[Path]:
+        entry = self.partitions.get(video_id)
+        return self.directory / entry['file'] if entry else None
+
+    def has(self, video_id: str) -> bool:
+        path = self.partition_path(video_id)
+        return path is not None and path.is_file()
+
+    def ids(self) -> List[str]:
+        return [video_id for video_id in self.partitions if self.has(video_id)]
+
+    def write(self, video_id: str, name: str, data: pd.DataFrame) -> Path:
+        """
+        Writes the partition of a video and records it in the manifest
+        :param name: file name of the partition, without extension
+        :return: path of the partition
+        """
+        # loaded before the partition exists, so it is not indexed as an unknown csv
+        partitions = self.partitions
+        path = self.directory / f'{name}.csv'
+        part_path = path.with_name(f'{path.name}.part')
+        data.to_csv(part_path, index=False)
+        os.replace(part_path, path)
+        entry = {'video_id': video_id, 'file': path.name, 'rows': len(data), 'written': time.time()}
+        with self._lock:
+            partitions[video_id] = entry
+            with open(self.manifest_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        return path
+
+    def read(self, ids: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """
+        :param ids: videos to read, all of them when None
+        :return: annotations of the selected videos, empty when none of them has been annotated
+        """
+        ids = self.ids() if ids is None else [video_id for video_id in ids if self.has(video_id)]
+        if not ids:
+            return pd.DataFrame()
+        return pd.concat([pd.read_csv(self.partition_path(video_id)) for video_id in ids], ignore_index=True)
+
+
+def read_annotations(project_dir: Path, service: str, ids: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    :param project_dir: main directory of the project
+    :param service: annotation service, name of the folder in data/
+    :param ids: videos to read, all of them when None
+    :return: annotations of the selected videos
+    """
+    return AnnotationDataset(Path(project_dir) / 'data' / service).read(ids)
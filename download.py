@@ -1,16 +1,29 @@
+import asyncio
 import concurrent.futures
+import csv
+import functools
+import glob
+import itertools
+import json
 import os
+import threading
+import time
+from urllib.error import URLError
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 
 import enquiries
 import isodate
-import pandas as pd
+import requests
 from googleapiclient.discovery import build
 from pytube import YouTube
 from tqdm import tqdm
 
-from utils import sanitize_video_title, seconds_to_string
+import youtube_async
+from api_cache import get_api_cache
+from scheduler import MEGABYTE, AdaptiveScheduler, retry_with_backoff
+from utils import (chunks, file_sha256, find_video_by_id, is_valid_video, sanitize_video_title,
+                   seconds_to_string)
 
 
 def find_txt_files(_dir, prompt):
@@ -34,6 +47,7 @@ def parse_txt(_filepath):
     return lines
 
 
+@functools.lru_cache(maxsize=None)
 def get_api_key():
     with open(find_txt_files(os.path.join(os.getcwd(), 'credentials'), "Select API Key"), encoding="utf8") as f:
         _api_key = f.readline()
@@ -50,54 +64,160 @@ def parse_duration(_duration):
     return duration.total_seconds()
 
 
-api_key = get_api_key()
-youtube = build('youtube', 'v3', developerKey=api_key)
-
-
-def compile_videos_report(_ids: List[str]) -> pd.DataFrame:
-    report = []
-    video_request = youtube.videos().list(
-        part="snippet,contentDetails,statistics",
-        id=_ids)
-
-    video_response = video_request.execute()
-    channels_ids = {video["snippet"]["channelId"] for video in video_response["items"]}
-
-    channel_request = youtube.channels().list(
-        part="snippet,contentDetails,statistics,contentOwnerDetails,topicDetails,brandingSettings",
-        id=list(channels_ids))
-    channel_response = channel_request.execute()
-    for video in video_response["items"]:
-        channel = next(
-            (channel for channel in channel_response["items"] if channel["id"] == video["snippet"]["channelId"]), None)
-        duration = parse_duration(video["contentDetails"]["duration"])
-        report.append({
-            "id": video.get("id", ""),
-            "title": video.get("snippet", {}).get("title", ""),
-            "duration": seconds_to_string(duration),
-            "duration_seconds": "%3f" % duration,
-            "channel": channel.get("snippet", {}).get("title", ""),
-            "views": video.get("statistics", {}).get("viewCount", ""),
-            "likes": video.get("statistics", {}).get("likeCount", ""),
-            "favorites": video.get("statistics", {}).get("favoriteCount", ""),
-            "comments": video.get("statistics", {}).get("commentCount", ""),
-            "date": video.get("snippet", {}).get("publishedAt", ""),
-            "licensed_content": video.get("contentDetails", {}).get("licensedContent", ""),
-            "tags": video.get("snippet", {}).get("tags", ""),
-            "description": video.get("snippet", {}).get("description", ""),
-            "url": "https://www.youtube.com/watch?v=" + video.get("id", ""),
-            "channel_creation_date": channel.get("snippet", {}).get("publishedAt", ""),
-            "channel_views": channel.get("statistics", {}).get("viewCount", ""),
-            "channel_subscribers": channel.get("statistics", {}).get("subscriberCount", ""),
-            "channel_videos": channel.get("statistics", {}).get("videoCount", ""),
-            "channel_country": channel.get("snippet", {}).get("country", ""),
-            "channel_topic_categories": channel.get("topicDetails", {}).get("topicCategories", ""),
-            "channel_keywords": channel.get("brandingSettings", {}).get("channel", {}).get("keywords", ""),
-            "channel_description": channel.get("snippet", {}).get("description", ""),
-            "channel_url": "https://www.youtube.com/channel/" + channel.get("id", ""),
-        })
-
-    return pd.DataFrame(report)
+_thread_local = threading.local()
+
+REPORT_PAGE_SIZE = 50
+REPORT_WORKERS = 8
+VIDEO_PARTS = "snippet,contentDetails,statistics"
+CHANNEL_PARTS = "snippet,contentDetails,statistics,contentOwnerDetails,topicDetails,brandingSettings"
+REPORT_COLUMNS = ["id", "title", "duration", "duration_seconds", "channel", "views", "likes", "favorites",
+                  "comments", "date", "licensed_content", "tags", "description", "url", "channel_creation_date",
+                  "channel_views", "channel_subscribers", "channel_videos", "channel_country",
+                  "channel_topic_categories", "channel_keywords", "channel_description", "channel_url"]
+MANIFEST_NAME = 'manifest.json'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024 * 9
+PROXY_MIN_HEIGHT = 360
+FULL_RESOLUTION_DIR = 'full'
+RETRYABLE_ERRORS = (requests.RequestException, ConnectionError, TimeoutError, URLError)
+
+
+def get_thread_youtube():
+    """
+    googleapiclient resources share a single httplib2.Http object which is not thread-safe,
+    so every worker thread builds its own client on first use. The API key is only read then
+    """
+    if not hasattr(_thread_local, 'youtube'):
+        _thread_local.youtube = build('youtube', 'v3', developerKey=get_api_key())
+    return _thread_local.youtube
+
+
+def list_cached(kind: str, _ids: List[str], parts: str) -> List[dict]:
+    """
+    Lists up to REPORT_PAGE_SIZE resources through the API cache. Only the parts that are missing or expired are
+    requested, using a partial response limited to those parts
+    :param kind: resource kind, 'videos' or 'channels'
+    :param _ids: resource ids
+    :param parts: comma separated parts
+    :return: resources found, in the order of the given ids
+    """
+    cache = get_api_cache()
+    items, stale = cache.get_parts(kind, _ids, parts.split(','))
+    if stale:
+        stale_parts = sorted(set().union(*stale.values()))
+        response = getattr(get_thread_youtube(), kind)().list(part=','.join(stale_parts), id=','.join(stale),
+                                                              fields=f"items(id,etag,{','.join(stale_parts)})",
+                                                              maxResults=REPORT_PAGE_SIZE).execute()
+        for item in response.get('items', []):
+            cache.put_item(kind, item, stale_parts)
+            items.setdefault(item['id'], {'id': item['id']}).update(
+                {part: item[part] for part in stale_parts if part in item})
+    return [items[_id] for _id in _ids if _id in items]
+
+
+class ChannelIndex:
+    """
+    Channel lookup shared by all report pages. Each channel id is requested only once, pages that need a
+    channel another page is already fetching wait for that result instead of requesting it again
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def get(self, channel_ids: List[str]) -> Dict[str, dict]:
+        with self._lock:
+            missing = [channel_id for channel_id in channel_ids if channel_id not in self._channels]
+            for channel_id in missing:
+                self._channels[channel_id] = concurrent.futures.Future()
+
+        try:
+            for page in chunks(missing, REPORT_PAGE_SIZE):
+                found = {channel['id']: channel for channel in list_cached('channels', page, CHANNEL_PARTS)}
+                for channel_id in page:
+                    self._channels[channel_id].set_result(found.get(channel_id, {}))
+        except Exception as e:
+            for channel_id in missing:
+                if not self._channels[channel_id].done():
+                    self._channels[channel_id].set_exception(e)
+            raise
+
+        return {channel_id: self._channels[channel_id].result() for channel_id in channel_ids}
+
+
+def build_report_row(video: dict, channel: dict) -> dict:
+    duration = parse_duration(video["contentDetails"]["duration"])
+    return {
+        "id": video.get("id", ""),
+        "title": video.get("snippet", {}).get("title", ""),
+        "duration": seconds_to_string(duration),
+        "duration_seconds": "%3f" % duration,
+        "channel": channel.get("snippet", {}).get("title", ""),
+        "views": video.get("statistics", {}).get("viewCount", ""),
+        "likes": video.get("statistics", {}).get("likeCount", ""),
+        "favorites": video.get("statistics", {}).get("favoriteCount", ""),
+        "comments": video.get("statistics", {}).get("commentCount", ""),
+        "date": video.get("snippet", {}).get("publishedAt", ""),
+        "licensed_content": video.get("contentDetails", {}).get("licensedContent", ""),
+        "tags": video.get("snippet", {}).get("tags", ""),
+        "description": video.get("snippet", {}).get("description", ""),
+        "url": "https://www.youtube.com/watch?v=" + video.get("id", ""),
+        "channel_creation_date": channel.get("snippet", {}).get("publishedAt", ""),
+        "channel_views": channel.get("statistics", {}).get("viewCount", ""),
+        "channel_subscribers": channel.get("statistics", {}).get("subscriberCount", ""),
+        "channel_videos": channel.get("statistics", {}).get("videoCount", ""),
+        "channel_country": channel.get("snippet", {}).get("country", ""),
+        "channel_topic_categories": channel.get("topicDetails", {}).get("topicCategories", ""),
+        "channel_keywords": channel.get("brandingSettings", {}).get("channel", {}).get("keywords", ""),
+        "channel_description": channel.get("snippet", {}).get("description", ""),
+        "channel_url": "https://www.youtube.com/channel/" + channel.get("id", ""),
+    }
+
+
+def compile_report_page(_ids: List[str], channel_index: ChannelIndex) -> List[dict]:
+    """
+    Builds the report rows for a single page of at most REPORT_PAGE_SIZE video ids
+    :param _ids: video ids of the page
+    :param channel_index: channel lookup shared between pages
+    :return: list of report rows
+    """
+    videos = list_cached('videos', _ids, VIDEO_PARTS)
+    channels = channel_index.get(list(dict.fromkeys(video["snippet"]["channelId"] for video in videos)))
+    return [build_report_row(video, channels[video["snippet"]["channelId"]]) for video in videos]
+
+
+def compile_videos_report(_ids: List[str], out_path: Path, max_workers: int = REPORT_WORKERS) -> int:
+    """
+    Compiles a report on the given videos and their channels. Ids are requested in pages of 50, the largest
+    page the API accepts, pages are fetched concurrently and rows are written to the csv as pages arrive
+    :param _ids: list of YouTube video ids
+    :param out_path: path of the csv report
+    :param max_workers: maximum number of pages requested at the same time
+    :return: number of rows written
+    """
+    pages = iter(chunks(list(dict.fromkeys(_ids)), REPORT_PAGE_SIZE))
+    channel_index = ChannelIndex()
+    rows_written = 0
+
+    with open(out_path, 'w', newline='', encoding='utf8') as f, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            tqdm(total=len(set(_ids)), desc="Compiling report") as pbar:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        # only keep a bounded number of pages in flight, so finished pages are written and released
+        # before new ones are requested
+        in_flight = {executor.submit(compile_report_page, page, channel_index): len(page)
+                     for page in itertools.islice(pages, max_workers * 2)}
+        while in_flight:
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                rows = future.result()
+                writer.writerows(rows)
+                rows_written += len(rows)
+                pbar.update(in_flight.pop(future))
+                for page in itertools.islice(pages, 1):
+                    in_flight[executor.submit(compile_report_page, page, channel_index)] = len(page)
+
+    return rows_written
 
 
 def get_video_ids_from_playlist(_id: str) -> List[str]:
@@ -106,21 +226,25 @@ def get_video_ids_from_playlist(_id: str) -> List[str]:
     :param _id: id of the playlist
     :return: list of video IDs
     """
+    return get_video_ids_from_playlists([_id])[_id]
 
-    pbar = None
-    result = youtube.playlistItems().list(part="snippet,contentDetails", playlistId=_id, maxResults=50).execute()
-    ids = [item['snippet']['resourceId']['videoId'] for item in result['items']]
-    if 'nextPageToken' in result:
-        pbar = tqdm(total=int(result['pageInfo']['totalResults']), desc="Loading playlist")
 
-    while len(ids) < result["pageInfo"]["totalResults"]:
-        result = youtube.playlistItems().list(part="snippet,contentDetails", playlistId=_id,
-                                              maxResults=50, pageToken=result['nextPageToken']).execute()
-        new_ids = [item['snippet']['resourceId']['videoId'] for item in result['items']]
-        ids.extend(new_ids)
-        pbar.update(len(new_ids))
+def get_video_ids_from_playlists(_ids: List[str]) -> Dict[str, List[str]]:
+    """
+    Crawls many public playlists concurrently
+    :param _ids: ids of the playlists
+    :return: list of video IDs for each playlist
+    """
+    return asyncio.run(youtube_async.crawl_playlists(get_api_key(), _ids))
 
-    return ids
+
+def get_video_ids_from_channels(_ids: List[str]) -> Dict[str, List[str]]:
+    """
+    Crawls the uploads of many public channels concurrently
+    :param _ids: ids of the channels
+    :return: list of video IDs for each channel
+    """
+    return asyncio.run(youtube_async.crawl_channels(get_api_key(), _ids))
 
 
 def get_uploads_playlist_id(_id: str) -> str:
@@ -128,8 +252,35 @@ def get_uploads_playlist_id(_id: str) -> str:
     Loads a channel from a given URL. Channel must be public.
     :return: id of the uploads playlist for the given channel id
     """
-    result = youtube.channels().list(part="snippet, contentDetails", id=_id).execute()
-    return result['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+    channel = list_cached('channels', [_id], 'contentDetails')[0]
+    return channel['contentDetails']['relatedPlaylists']['uploads']
+
+
+def search_channels(_query: str) -> List[dict]:
+    """
+    :param _query: Channel name
+    :return: channel search results, only carrying channel id and title
+    """
+    return asyncio.run(youtube_async.search_channels(get_api_key(), _query))
+
+
+def split_playlists_and_channels(_lines: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Sorts playlist and channel URLs or ids, as found in a txt file, into playlist ids and channel ids
+    :param _lines: list of URLs or ids
+    :return: playlist ids, channel ids
+    """
+    playlist_ids, channel_ids = [], []
+    for line in filter(None, _lines):
+        if 'list=' in line:
+            playlist_ids.append(line.split('list=')[1].split('&')[0])
+        elif '/channel/' in line:
+            channel_ids.append(line.split('/channel/')[1].split('/')[0])
+        elif line.startswith('UC') and len(line) == 24:
+            channel_ids.append(line)
+        else:
+            playlist_ids.append(line)
+    return playlist_ids, channel_ids
 
 
 def find_channel_id(_query: str) -> str:
@@ -141,7 +292,7 @@ def find_channel_id(_query: str) -> str:
     :param _query: Channel name
     :return: Channel ID
     """
-    return youtube.search().list(part="snippet", q=_query, type="channel").execute()['items'][0]['id']['channelId']
+    return search_channels(_query)[0]['id']['channelId']
 
 
 def search_channel_id(_query: str) -> str:
@@ -150,11 +301,10 @@ def search_channel_id(_query: str) -> str:
     :param _query: Channel name
     :return: Channel ID
     """
-    channels = youtube.search().list(part="snippet", q=_query,
-                                     type="channel").execute()  # ['items'][0]['id']['channelId']
+    channels = search_channels(_query)
     selected_channel = enquiries.choose("Select channel:",
                                         choices=[[channel['snippet']['title'], channel['id']['channelId']]
-                                                 for channel in channels['items']], multi=False)
+                                                 for channel in channels], multi=False)
     return selected_channel[1]
 
 
@@ -187,37 +337,212 @@ def search_channel_id(_query: str) -> str:
 ##              pbar.update(1)
 
 
-def download_video(_id: str, _output_dir: str) -> str:
+class DownloadManifest:
+    """
+    Keeps track of the downloads in a directory through its manifest.json: for each video id the file name,
+    expected size, sha256 and whether ffprobe could read the file. Only videos recorded here are complete.
+    """
+
+    def __init__(self, output_dir: Path):
+        self.path = output_dir / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self.entries = json.loads(self.path.read_text(encoding='utf8')) if self.path.is_file() else {}
+
+    def complete_path(self, video_id: str, profile: str = None) -> Optional[Path]:
+        """
+        Returns the path of the video if it was fully downloaded and verified and still has the expected size
+        :param profile: if 'full', analysis proxies do not count as complete. Videos recorded as 'legacy' count as
+        full resolution, runs without profiles only downloaded the highest resolution
+        """
+        entry = self.entries.get(video_id)
+        if entry is None or not entry.get('verified'):
+            return None
+        if profile == 'full' and entry.get('profile', 'full') not in ('full', 'legacy'):
+            return None
+        path = self.path.parent / entry['filename']
+        return path if path.is_file() and path.stat().st_size == entry['size'] else None
+
+    def record(self, video_id: str, **entry) -> None:
+        with self._lock:
+            self.entries[video_id] = entry
+            tmp_path = self.path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.entries, indent=2), encoding='utf8')
+            os.replace(tmp_path, self.path)
+
+
+def fetch_resumable(url: str, part_path: Path, size: int, on_bytes: Callable[[int], None] = None) -> None:
+    """
+    Downloads a file with byte-range requests, appending to whatever a previous attempt left in part_path
+    :param url: url of the stream
+    :param part_path: path of the partial file
+    :param size: expected size of the file in bytes
+    :param on_bytes: called with the size of every block received
+    """
+    done = part_path.stat().st_size if part_path.is_file() else 0
+    if done > size:
+        part_path.unlink()
+        done = 0
+
+    with requests.Session() as session, open(part_path, 'ab') as f:
+        while done < size:
+            end = min(done + DOWNLOAD_CHUNK_SIZE, size) - 1
+            with session.get(url, headers={'Range': f'bytes={done}-{end}'}, stream=True, timeout=30) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise ConnectionError(f"Server ignored range request, status {r.status_code}")
+                for block in r.iter_content(chunk_size=1024 * 256):
+                    f.write(block)
+                    done += len(block)
+                    if on_bytes is not None:
+                        on_bytes(len(block))
+            if done <= end:
+                raise ConnectionError(f"Connection closed at byte {done} of {size}")
+
+
+def select_stream(yt: YouTube, profile: str):
+    """
+    :param yt: pytube video
+    :param profile: 'proxy' for the smallest progressive mp4 at least PROXY_MIN_HEIGHT pixels high,
+    'full' for the highest resolution progressive mp4
+    :return: selected stream
     """
-    Downloads a video from a given ID
+    streams = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution')
+    if profile == 'proxy':
+        proxies = [stream for stream in streams.asc() if int(stream.resolution.rstrip('p')) >= PROXY_MIN_HEIGHT]
+        if proxies:
+            return proxies[0]
+    return streams.desc().first()
+
+
+def stream_part_path(path: Path, stream) -> Path:
+    """:return: path of the partial download of a stream, named after its itag and size, no other stream resumes it"""
+    return path.with_name(f'{path.name}.{stream.itag}-{stream.filesize}.part')
+
+
+def discard_stale_parts(path: Path, part_path: Path) -> None:
+    """Deletes the partial downloads of a video left by other streams, or by runs that did not name them by stream"""
+    for stale in path.parent.glob(glob.escape(path.name) + '.*part'):
+        if stale != part_path:
+            stale.unlink()
+
+
+def fetch_video(_id: str, _output_dir: str, manifest: DownloadManifest,
+                on_bytes: Callable[[int], None] = None, profile: str = 'proxy') -> str:
+    """
+    Downloads a video from a given ID. The video is written to a .part file named after the stream, which is renamed
+    only once it is complete and readable by ffprobe. Interrupted downloads are resumed on the next attempt of the
+    same stream, partial files of other streams are deleted
     :param _id: id of the video to download
     :param _output_dir: Directory where to save the video
+    :param manifest: manifest of the output directory
+    :param on_bytes: called with the size of every block received
+    :param profile: 'proxy' for a low resolution analysis proxy, 'full' for the highest resolution available
     :return: Path of the downloaded video
     """
+    complete_path = manifest.complete_path(_id, profile)
+    if complete_path is not None:
+        return str(complete_path)
+
+    yt = YouTube(f'https://www.youtube.com/watch?v={_id}')
+    title = sanitize_video_title(yt.title)
+    path = Path(_output_dir) / f"[{_id}]_{title}.mp4"
+    stream = select_stream(yt, profile)
+    if path.is_file():
+        # left by a run without a manifest entry. Older runs always downloaded the highest resolution stream, a file
+        # of exactly its size is complete, any other one may be truncated, its moov header still readable, and is
+        # downloaded again. It is never resumed as a partial download
+        full_stream = stream if profile == 'full' else select_stream(yt, 'full')
+        size = path.stat().st_size
+        matched = next((candidate for candidate in (full_stream, stream) if candidate.filesize == size), None)
+        if matched is not None and is_valid_video(path):
+            manifest.record(_id, filename=path.name, size=size, sha256=file_sha256(path), itag=matched.itag,
+                            verified=True, profile='full' if matched is full_stream else profile,
+                            resolution=matched.resolution)
+            return str(path)
+    part_path = stream_part_path(path, stream)
+    discard_stale_parts(path, part_path)
+
+    start = time.monotonic()
+    resumed_from = part_path.stat().st_size if part_path.is_file() else 0
+    fetch_resumable(stream.url, part_path, stream.filesize, on_bytes)
+    elapsed = time.monotonic() - start
+    if not is_valid_video(part_path):
+        part_path.unlink()
+        raise ValueError("downloaded file is not a readable video")
+    sha256 = file_sha256(part_path)
+    os.replace(part_path, path)
+    manifest.record(_id, filename=path.name, size=stream.filesize, sha256=sha256, itag=stream.itag, verified=True,
+                    profile=profile, resolution=stream.resolution, seconds=round(elapsed, 2),
+                    mb_per_second=round((stream.filesize - resumed_from) / MEGABYTE / max(elapsed, 1e-6), 2))
+    return str(path)
+
+
+def download_video(_id: str, _output_dir: str, manifest: DownloadManifest = None,
+                   scheduler: AdaptiveScheduler = None, profile: str = 'proxy') -> str:
+    """
+    Downloads a video from a given ID, retrying with exponential backoff on network errors
+    :param _id: id of the video to download
+    :param _output_dir: Directory where to save the video
+    :param manifest: manifest of the output directory
+    :param scheduler: scheduler to report throughput and errors to
+    :param profile: 'proxy' for a low resolution analysis proxy, 'full' for the highest resolution available
+    :return: Path of the downloaded video
+    """
+    manifest = manifest or DownloadManifest(Path(_output_dir))
     try:
-        yt = YouTube(f'https://www.youtube.com/watch?v={_id}')
-        title = sanitize_video_title(yt.title)
-        path = Path(_output_dir) / f"[{_id}]_{title}.mp4"
-        yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first().download(
-            _output_dir, filename=path.name, filename_prefix='', skip_existing=True)
-        return str(path)
+        return retry_with_backoff(fetch_video, _id, _output_dir, manifest, scheduler and scheduler.on_bytes, profile,
+                                  retry_on=RETRYABLE_ERRORS, on_retry=scheduler and scheduler.on_error)
     except Exception as e:
         print(f"Error downloading video {_id}: {e}")
         return None
 
 
-def download_videos(_ids: List[str], output_dir: Path) -> None:
+def download_videos(_ids: List[str], output_dir: Path, bandwidth_limit: float = None,
+                    profile: str = 'proxy') -> None:
     """
-    Downloads videos of videos from a given list of URLs
+    Downloads videos of videos from a given list of URLs. The number of parallel downloads adapts to the
+    observed throughput and backs off on errors
     :param output_dir: directory where to save the videos
     :param _ids: List of YouTube ids of the videos to download
+    :param bandwidth_limit: global cap in MB/s, None for no limit
+    :param profile: 'proxy' to store low resolution analysis proxies, the full resolution is then fetched by
+    find_full_video_by_id when an edit needs it. 'full' to store the highest resolution available
     :return:
     """
     output_dir.mkdir(exist_ok=True)
+    manifest = DownloadManifest(output_dir)
+    scheduler = AdaptiveScheduler(bandwidth_limit=bandwidth_limit and bandwidth_limit * MEGABYTE)
     pbar = tqdm(total=len(_ids), desc="Downloading videos")
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(download_video, _id, output_dir.as_posix()) for _id in _ids]
-        for future in concurrent.futures.as_completed(futures):
-            if future.result() is None:
-                print("Video not downloaded")
-            pbar.update(1)
+    jobs = [(_id, output_dir.as_posix(), manifest, scheduler, profile) for _id in _ids]
+    for future in scheduler.run(download_video, jobs):
+        if future.result() is None:
+            print("Video not downloaded")
+        pbar.set_postfix_str(f"{scheduler.meter.rate() / MEGABYTE:.1f} MB/s, {scheduler.limit} parallel")
+        pbar.update(1)
+
+
+def find_full_video_by_id(video_id: str, in_dir: Path) -> Path:
+    """
+    Finds the full resolution version of a video, downloading it into in_dir/full the first time it is needed
+    if in_dir only holds its analysis proxy. Falls back to the proxy if the download fails
+    :param video_id: video id
+    :param in_dir: download directory of the project
+    :return: path of the full resolution video
+    """
+    manifest = DownloadManifest(in_dir)
+    complete_path = manifest.complete_path(video_id, 'full')
+    if complete_path is not None:
+        return complete_path
+    if video_id not in manifest.entries:
+        # downloaded before the manifest existed, when only the highest resolution was downloaded
+        try:
+            return find_video_by_id(video_id, in_dir)
+        except FileNotFoundError:
+            pass
+    full_dir = in_dir / FULL_RESOLUTION_DIR
+    full_dir.mkdir(exist_ok=True)
+    path = download_video(video_id, full_dir.as_posix(), profile='full')
+    if path is None:
+        print(f"Using the analysis proxy of {video_id}")
+        return find_video_by_id(video_id, in_dir)
+    return Path(path)
@@ -0,0 +1,107 @@
+import queue
+import subprocess
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import find_video_info
+
+DEFAULT_FPS = 25.0
+# frames decoded ahead of the consumer, each one is width * height * 3 bytes
+BUFFER_FRAMES = 32
+# timestamps further apart than this are read by separate ffmpeg processes that seek to them, instead of decoding
+# every frame in between
+SEEK_GAP = 10.0
+
+
+def frame_runs(frame_indexes: np.ndarray, max_gap: int) -> List[np.ndarray]:
+    """:return: sorted frame indexes split where two consecutive ones are more than max_gap frames apart"""
+    return np.split(frame_indexes, np.flatnonzero(np.diff(frame_indexes) > max_gap) + 1)
+
+
+def decode_run(path: Path, fps: float, width: int, height: int, first: int,
+               last: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Decodes the frames from first to last with a single ffmpeg process, at a constant frame rate
+    :param width: width the frames are scaled to
+    :param height: height the frames are scaled to
+    :return: index and rgb array of every frame, arrays are read-only
+    """
+    frame_size = width * height * 3
+    command = ['ffmpeg', '-v', 'error', '-ss', str(first / fps), '-i', path.as_posix(), '-an', '-vf',
+               f'fps={fps},scale={width}:{height}', '-frames:v', str(last - first + 1), '-f', 'rawvideo',
+               '-pix_fmt', 'rgb24', '-']
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        try:
+            for index in range(first, last + 1):
+                data = process.stdout.read(frame_size)
+                if len(data) < frame_size:
+                    break
+                yield index, np.frombuffer(data, np.uint8).reshape(height, width, 3)
+        finally:
+            process.kill()
+
+
+def read_frames(path: Path, timestamps: Iterable[float], size: Optional[Tuple[int, int]] = None,
+                buffer_frames: int = BUFFER_FRAMES) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Reads the frames of a video at many timestamps, decoding each stretch of the video once instead of seeking to
+    every timestamp. Decoding runs in a background thread, at most buffer_frames ahead of the consumer
+    :param path: path of the video
+    :param timestamps: times of the frames to read, in seconds, in any order
+    :param size: width and height the frames are scaled to, defaults to the size of the video
+    :param buffer_frames: number of decoded frames kept in memory
+    :return: timestamp and rgb array of every frame, sorted by timestamp. Arrays are read-only and can be shared by
+    timestamps falling on the same frame, timestamps past the end of the video are missing
+    """
+    info = find_video_info(path)
+    fps = info['fps'] or DEFAULT_FPS
+    width, height = size or (info['width'], info['height'])
+    times = np.unique(np.asarray(list(timestamps), dtype=float))
+    if not len(times):
+        return
+    indexes = np.round(times * fps).astype(np.int64)
+
+    frames = queue.Queue(maxsize=max(1, buffer_frames))
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decode():
+        try:
+            position = 0
+            for run in frame_runs(np.unique(indexes), round(SEEK_GAP * fps)):
+                for index, frame in decode_run(path, fps, width, height, int(run[0]), int(run[-1])):
+                    while position < len(times) and indexes[position] < index:
+                        position += 1
+                    while position < len(times) and indexes[position] == index:
+                        if not put((times[position], frame)):
+                            return
+                        position += 1
+            put(done)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=decode, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield float(item[0]), item[1]
+    finally:
+        stop.set()
+        thread.join()
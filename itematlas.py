@@ -7,8 +7,8 @@ import pandas as pd
 import tqdm
 from PIL import Image
 
-import analysis
-from object_tracking_operations import (extract_frame, extract_object_thumbs,
+from dataset import read_annotations
+from object_tracking_operations import (extract_frames, extract_object_thumbs,
                                         interpolate_missing_data, mask_frame)
 from utils import (copy_visualiser_dir, ensure_coords, find_video_by_id,
                    serve_directory, uniquify)
@@ -187,9 +187,8 @@ def make_thumb_trace(in_dir: Path, out_dir: Path, data: pd.DataFrame, key: str):
     :param data: object tracking data
     :param key: object identifier
     """
-    # Select data and add rows to increase extraction granularity
+    # Select data and resample it to increase extraction granularity
     data = data[data["object_id"] == key]
-    data = data.sort_values(by="time_seconds")
     data = interpolate_missing_data(data)
     data = data.reset_index(drop=True)
 
@@ -205,13 +204,7 @@ def make_thumb_trace(in_dir: Path, out_dir: Path, data: pd.DataFrame, key: str):
         out_frames.mkdir(exist_ok=True)
         out_thumbs.mkdir(exist_ok=True)
 
-        with tqdm.tqdm(total=len(data), desc="Extracting frames") as pbar:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                futures = []
-                for _, row in data.iterrows():
-                    futures.append(executor.submit(extract_frame, video, out_frames, row["time_seconds"], object_id, object_name))
-                for future in concurrent.futures.as_completed(futures):
-                    pbar.update()
+        extract_frames(video, out_frames, data["time_seconds"], object_id, object_name)
 
         with tqdm.tqdm(total=len(data), desc="Masking frames") as pbar:
             with concurrent.futures.ThreadPoolExecutor() as executor:
@@ -245,16 +238,14 @@ def make_thumb_trace(in_dir: Path, out_dir: Path, data: pd.DataFrame, key: str):
 
 
 def serve_itematlas(project_dir: Path):
-    data_path = project_dir / 'data' / 'object_tracking' / 'merged.csv'
-    
-    try:
-        data = pd.read_csv(data_path)
-    except FileNotFoundError:
+    data = read_annotations(project_dir, 'object_tracking')
+    if data.empty:
+        import analysis
         import utils
         print("Object Tracking data not found, running analysis on all downloaded videos...")
         video_ids = [utils.parse_id(v.stem) for v in project_dir.glob('download/*.mp4')]
         analysis.batch_annotate_from_ids(video_ids, 'object_tracking', project_dir)
-        data = pd.read_csv(data_path)
+        data = read_annotations(project_dir, 'object_tracking')
 
     momentmap_dest = copy_visualiser_dir(project_dir, 'itematlas')
     object_data = compile_most_present_objects(data)
@@ -1,5 +1,10 @@
+import time
+
+_start = time.perf_counter()
+
 import enquiries
 import os
+import sys
 from project import (analysis_handler, download_handler, edit_handler,
                      ensure_mismas, project_dir_handler, report_handler)
 
@@ -10,6 +15,16 @@ ACTIONS = {
     '[>] Edit': edit_handler,
 }
 
+# Seconds main.py may take to import everything it needs to show the first menu
+STARTUP_BUDGET = 1.0
+startup_time = time.perf_counter() - _start
+
+
+def check_startup_time() -> None:
+    """Reports the startup time, exits with an error if it exceeds STARTUP_BUDGET"""
+    print(f'Startup time: {startup_time:.3f}s (budget {STARTUP_BUDGET:.3f}s)')
+    sys.exit(0 if startup_time <= STARTUP_BUDGET else 1)
+
 
 def main():
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -28,4 +43,6 @@ def main():
 
 
 if __name__ == '__main__':
+    if '--startup-time' in sys.argv:
+        check_startup_time()
     main()
@@ -1,12 +1,11 @@
 import concurrent.futures
-import shutil
 import subprocess
 from pathlib import Path
 
 import pandas as pd
 import tqdm
 
-import analysis
+from dataset import read_annotations
 from utils import copy_visualiser_dir, find_video_by_id, serve_directory
 
 
@@ -57,23 +56,19 @@ def extract_playback_frames(project_dir: Path, data: pd.DataFrame):
 
 def serve_momentmap(project_dir: Path):
     print("momentmap")
-    data_path = project_dir / "data" / "playback" / "merged.csv"
+    data = read_annotations(project_dir, "playback")
 
-    try:
-        data = pd.read_csv(data_path)
-    except FileNotFoundError:
+    if data.empty:
+        import analysis
         import utils
 
         print("Playback data not found, running analysis on all downloaded videos...")
         video_ids = [utils.parse_id(v.stem) for v in project_dir.glob("download/*.mp4")]
         analysis.most_replayed(video_ids, project_dir)
-        data = pd.read_csv(data_path)
+        data = read_annotations(project_dir, "playback")
 
     momentmap_dest = copy_visualiser_dir(project_dir, "momentmap")
-    shutil.copy(
-        project_dir / "data" / "playback" / "merged.csv",
-        momentmap_dest / "data" / "playback_data.csv",
-    )
+    data.to_csv(momentmap_dest / "data" / "playback_data.csv", index=False)
 
     extract_playback_frames(project_dir, data)
 
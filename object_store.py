@@ -0,0 +1,41 @@
+import os
+import shutil
+from pathlib import Path
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class LocalObjectStore:
+    """
+    Local stand-in for a storage bucket. Videos are put under a directory and requests reference them by URI,
+    so the video bytes never go through the request itself. The URIs are file:// ones, which the Video Intelligence
+    API does not accept: it only reads input_uri from gs:// URIs. This store only works with the offline client of
+    the benchmarks, a bucket backed store has to provide the same upload method returning gs:// URIs.
+    """
+    uri_scheme = 'file'
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def upload(self, path: Path) -> str:
+        """
+        Puts a file in the store, hard linked when possible and otherwise copied in fixed size chunks, so memory
+        use does not depend on the size of the file. Files already in the store are not uploaded again
+        :param path: file to upload
+        :return: URI of the stored file
+        """
+        target = self.root / path.name
+        if not target.is_file() or target.stat().st_size != path.stat().st_size:
+            part_path = target.with_name(f'{target.name}.part')
+            part_path.unlink(missing_ok=True)
+            try:
+                os.link(path, part_path)
+            except OSError:
+                with open(path, 'rb') as source, open(part_path, 'wb') as destination:
+                    shutil.copyfileobj(source, destination, COPY_CHUNK_SIZE)
+            os.replace(part_path, target)
+        return target.resolve().as_uri()
+
+    def delete(self, uri: str) -> None:
+        (self.root / uri.rsplit('/', 1)[-1]).unlink(missing_ok=True)
@@ -1,19 +1,20 @@
 import concurrent.futures
-import re
-import shutil
+import itertools
+import os
 import subprocess
-import tempfile
 import warnings
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from PIL import Image, ImageDraw
+from PIL import Image, ImageColor, ImageDraw
 from tqdm import tqdm
 
-from metavideo import crop_thumbs_to_normalised_size, get_min_thumbs_size_data
-from utils import (clean_user_input, ensure_coords, find_longest_video,
+from catalog import find_video_info
+from download import find_full_video_by_id
+from frame_reader import BUFFER_FRAMES, read_frames
+from utils import (clean_user_input, ensure_coords, ensure_even, find_longest_video,
                    find_video_by_id, uniquify)
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
@@ -22,61 +23,122 @@ warnings.simplefilter(action="ignore", category=FutureWarning)
 # TODO: Code in this file can be made much more efficent using ffmpeg to crop 
 
 
-def add_rows(data: pd.DataFrame) -> pd.DataFrame:
-    data = data.reindex(index=data.index.repeat(2))
-    data = data.iloc[1:]
-    data.loc[1:data.shape[0]:2] = np.nan
-    data.loc[:, :3] = data.iloc[:, :3].ffill()
-    return data.reset_index(drop=True)
+DEFAULT_FPS = 20
+BOX_COLUMNS = ["left", "top", "right", "bottom"]
+# cropped thumbnails waiting for the jpg encoder, per video
+MAX_PENDING_THUMBS = 256
+ANIMATION_FPS = 12
+ANIMATION_OPTIONS = {
+    "gif": ["-vf", "split[a][b];[a]palettegen[p];[b][p]paletteuse", "-loop", "0"],
+    "webp": ["-c:v", "libwebp_anim", "-loop", "0", "-quality", "80"],
+    "mp4": ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+}
 
 
-def interpolate_subsection(data: pd.DataFrame) -> pd.DataFrame:
-    data.iloc[:, 3:] = data.iloc[:, 3:].astype(float)
-    data.iloc[:, 3:] = (
-        data.iloc[:, 3:].interpolate(method="linear", axis=0).ffill().bfill()
-    )
-    return data
+def track_grid(starts: np.ndarray, ends: np.ndarray, fps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Frame times of every track on a regular grid, aligned to multiples of 1 / fps so tracks of the same video share
+    their frames. Tracks shorter than a frame keep their first time
+    :param starts: first time of every track
+    :param ends: last time of every track
+    :param fps: sampling rate of every track
+    :return: track index and time of every frame
+    """
+    first = np.ceil(starts * fps - 1e-6)
+    last = np.floor(ends * fps + 1e-6)
+    counts = np.maximum(last - first + 1, 1).astype(np.int64)
+    track = np.repeat(np.arange(len(starts)), counts)
+    frame = first[track] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    times = np.where(first[track] > last[track], starts[track], frame / fps[track])
+    return track, times
+
+
+def timestamp_grid(starts: np.ndarray, ends: np.ndarray, timestamps) -> Tuple[np.ndarray, np.ndarray]:
+    """:return: track index and time of the given timestamps that fall within every track"""
+    timestamps = np.unique(np.asarray(timestamps, dtype=float))
+    low = np.searchsorted(timestamps, starts, side="left")
+    counts = np.searchsorted(timestamps, ends, side="right") - low
+    track = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return track, timestamps[low[track] + offsets]
+
+
+def native_fps(data: pd.DataFrame, in_dir: Path) -> Dict[str, float]:
+    """:return: frame rate of the video of every id in the data, as found in in_dir"""
+    return {video_id: find_video_info(find_video_by_id(video_id, in_dir))["fps"] or DEFAULT_FPS
+            for video_id in data["id"].unique()}
 
 
-def interpolate_missing_data(data: pd.DataFrame) -> pd.DataFrame:
+def interpolate_missing_data(data: pd.DataFrame, fps: Union[float, Dict[str, float]] = DEFAULT_FPS,
+                             timestamps: Optional[Iterable[float]] = None) -> pd.DataFrame:
     """
-    Interpolate missing data in the dataframe, this brings the sampling rate to 20 fps
+    Resamples every track on a new time grid, interpolating the bounding boxes linearly between the frames returned
+    by the API. Tracks are not extended past their first and last frame
     :param data: data returned from the object tracking call to the API
-    :return: dataframe with interpolated data
+    :param fps: sampling rate of the new grid, or rate of every video id, see native_fps
+    :param timestamps: times of the new grid, used instead of fps
+    :return: dataframe with one row per object and time of the grid
     """
-    unique_objects = data["object_id"].unique()
-    interpolated_data = pd.DataFrame()
-    pd.options.mode.chained_assignment = None
-    for object_data in tqdm(
-            unique_objects, desc="Interpolating data to generate new frames"
-    ):
-        object_rows = data.groupby("object_id").get_group(object_data).reset_index(drop=True)
-        object_rows = add_rows(object_rows)
-        object_rows = interpolate_subsection(object_rows)
-        interpolated_data = interpolated_data.append(object_rows)
-    interpolated_data = interpolated_data.reset_index(drop=True)
-    return interpolated_data
-
-
-def extract_frame(in_path: Path, out_dir: Path, timestamp: float, object_id: str, object_name: str) -> int:
-    out_path = out_dir / f"{object_name}_{object_id}_[{timestamp:1.3f}].jpg"
-    cmd = ["ffmpeg", "-y", "-ss", str(timestamp), "-i", in_path.as_posix(), "-vframes", "1",
-           "-q:v", "2", out_path.as_posix()]
-    operation = subprocess.run(
-        cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
-    )
-    return operation.returncode
-
+    if data.empty:
+        return data.reset_index(drop=True)
+    data = data.sort_values(["object_id", "time_seconds"], kind="stable").reset_index(drop=True)
+    codes, _ = pd.factorize(data["object_id"])
+    source_times = data["time_seconds"].to_numpy(dtype=float)
+    boxes = data[BOX_COLUMNS].to_numpy(dtype=float)
+
+    # rows of a track are contiguous after sorting
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    first_rows = np.concatenate([[0], bounds])
+    last_rows = np.concatenate([bounds, [len(data)]]) - 1
+    starts, ends = source_times[first_rows], source_times[last_rows]
+
+    if timestamps is not None:
+        track, times = timestamp_grid(starts, ends, timestamps)
+    else:
+        if isinstance(fps, dict):
+            rates = data["id"].iloc[first_rows].map(fps).fillna(DEFAULT_FPS).to_numpy(dtype=float)
+        else:
+            rates = np.full(len(first_rows), float(fps))
+        track, times = track_grid(starts, ends, rates)
+
+    # every track is moved past the time span of the ones before it, so a single search finds the frames around every
+    # new time within its own track
+    span = source_times.max() - source_times.min() + 1
+    shifted_source = source_times + codes * span
+    before = np.searchsorted(shifted_source, times + track * span, side="right") - 1
+    before = np.clip(before, first_rows[track], np.maximum(last_rows[track] - 1, first_rows[track]))
+    after = np.minimum(before + 1, last_rows[track])
+    gap = source_times[after] - source_times[before]
+    weight = np.divide(times - source_times[before], gap, out=np.zeros_like(times), where=gap > 0).clip(0, 1)
+
+    resampled = data.iloc[first_rows[track]].reset_index(drop=True)
+    resampled["time_seconds"] = times
+    resampled[BOX_COLUMNS] = boxes[before] + weight[:, None] * (boxes[after] - boxes[before])
+    return resampled
+
+
+def extract_frames(in_path: Path, out_dir: Path, timestamps, object_id: str, object_name: str,
+                   max_pending: int = BUFFER_FRAMES) -> None:
+    """
+    Saves the frames of a video at many timestamps as jpg files, decoding the video once
+    :param in_path: path of the video
+    :param out_dir: directory of the frames, named {object_name}_{object_id}_[{timestamp}].jpg
+    :param timestamps: times of the frames in seconds
+    :param max_pending: frames waiting to be encoded, decoding pauses when they are this many
+    """
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        pending = set()
+        for timestamp, frame in read_frames(in_path, timestamps):
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(Image.fromarray(frame).save,
+                                        out_dir / f"{object_name}_{object_id}_[{timestamp:1.3f}].jpg", quality=95))
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
 
-def masked_frames_to_video(in_dir: Path, out_path: Path, fps: int):
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path = uniquify(out_path.as_posix())
-    fps = str(fps)
-    args = ["ffmpeg", "-threads", "0", "-framerate", fps, "-pattern_type", "glob", "-i", "*.jpg", "-c:v",
-            "libx264", "-y", out_path]
-    subprocess.run(args, cwd=in_dir.as_posix(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
 
-    
 def draw_mask(image: Image, left: float, top: float, right: float, bottom: float, color):
     """
     :param: color: tuple of (r, g, b, a) values
@@ -100,61 +162,86 @@ def mask_frame(in_path: Path, out_path: Path, left: float, top: float, right: fl
     image.save(out_path.as_posix())
 
 
-def mask_frames(in_dir: Path, out_dir: Path, data: pd.DataFrame, **kwargs):
-    color = "black" if "color" not in kwargs else kwargs["color"]
-    out_dir.mkdir(parents=True, exist_ok=True)
-    for _, row in data.iterrows():
-        in_path = Path(
-            in_dir,
-            f"{row['object_name']}_{row['object_id']}_[{row['time_seconds']:1.3f}].png",
-        )
-        left, top, right, bottom = ensure_coords(
-            row["left"], row["top"], row["right"], row["bottom"]
-        )
-        mask_frame(in_path, out_dir, left, top, right, bottom, color)
-
-
-def extract_masked_object_clips(in_dir: Path, out_dir: Path, data: pd.DataFrame, **kwargs):
+def mask_array(frame: np.ndarray, left: float, top: float, right: float, bottom: float,
+               color: Tuple[int, ...]) -> np.ndarray:
+    """
+    :param frame: rgb frame
+    :param color: rgb or rgba color of the masked area, alpha is ignored
+    :return: copy of the frame filled with color outside the box
+    """
+    h, w = frame.shape[:2]
+    left, top, right, bottom = ensure_coords(left, top, right, bottom)
+    left, top, right, bottom = int(left * w), int(top * h), int(right * w), int(bottom * h)
+    masked = np.empty_like(frame)
+    masked[:] = color[:3]
+    masked[top:bottom, left:right] = frame[top:bottom, left:right]
+    return masked
+
+
+def write_masked_clip(video_path: Path, out_path: Path, object_data: pd.DataFrame, color: Tuple[int, ...],
+                      fps: float) -> Path:
+    """
+    Decodes the frames of an object once, masks them in memory and pipes them to an ffmpeg encoder
+    :param video_path: video the object was tracked in
+    :param out_path: path of the clip
+    :param object_data: tracking rows of the object, one frame of the clip per timestamp
+    :param color: rgb or rgba color of the masked area
+    :param fps: frame rate of the clip
+    :return: path of the clip
     """
-    Generates a video for each object in the data frame, isolating the object in the video
+    boxes = object_data.drop_duplicates("time_seconds").set_index("time_seconds")[BOX_COLUMNS]
+    frames = read_frames(video_path, boxes.index)
+    first = next(frames, None)
+    if first is None:
+        raise ValueError(f"no frames of {video_path.name} at the tracked timestamps")
+    h, w = first[1].shape[:2]
+    cmd = ["ffmpeg", "-y", "-v", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}", "-framerate",
+           str(fps), "-i", "-", "-vf", "crop=trunc(iw/2)*2:trunc(ih/2)*2", "-c:v", "libx264", "-pix_fmt", "yuv420p",
+           out_path.as_posix()]
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) as process:
+        try:
+            for timestamp, frame in itertools.chain([first], frames):
+                process.stdin.write(mask_array(frame, *boxes.loc[timestamp], color).tobytes())
+        finally:
+            process.stdin.close()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+    return out_path
+
+
+def extract_masked_object_clips(in_dir: Path, out_dir: Path, data: pd.DataFrame, full_resolution: bool = False,
+                                fps: float = DEFAULT_FPS, **kwargs):
+    """
+    Generates a video for each object in the data frame, isolating the object in the video. Objects are encoded in
+    parallel on a process pool, frames never touch the disk
     :param in_dir: directory where the video is stored
     :param out_dir: directory where to save generated videos
-    :param data: object tracking annotations
+    :param data: object tracking annotations, sampled at fps, see interpolate_missing_data
+    :param full_resolution: use the full resolution videos, downloading them if in_dir only has analysis proxies
+    :param fps: frame rate of the clips
     :param kwargs: color=tuple(r, g, b, a) to specify the color of the masked area
     :return:
     """
+    color = kwargs.get("color", "black")
+    color = ImageColor.getrgb(color) if isinstance(color, str) else color
+    find_video = find_full_video_by_id if full_resolution else find_video_by_id
     out_dir.mkdir(parents=True, exist_ok=True)
-    executor = concurrent.futures.ThreadPoolExecutor()
-    pbar = tqdm(
-        total=len(data["object_id"].unique()), desc="Extracting masked object clips"
-    )
-
-    for object_id in data["object_id"].unique():
-        temp_dir = tempfile.TemporaryDirectory()
-        object_data = data.groupby("object_id").get_group(object_id)
-        object_name = object_data["object_name"].iat[0]
-        timestamps = object_data["time_seconds"].unique()
-
-        video_path = find_video_by_id(object_data["id"].iat[0], in_dir)
-        frames_out_dir = Path(temp_dir.name, "frames")
-        frames_out_dir.mkdir(parents=True, exist_ok=True)
-
-        futures = [
-            executor.submit(extract_frame, video_path, frames_out_dir, timestamp, object_id, object_name)
-            for timestamp in timestamps
-        ]
-        concurrent.futures.wait(futures)
-
-        masked_frames_out_dir = Path(temp_dir.name, "masked_frames")
-        masked_frames_out_dir.mkdir(parents=True, exist_ok=True)
-
-        mask_frames(frames_out_dir, masked_frames_out_dir, object_data, **kwargs)
-
-        vid_out_path = Path(out_dir, f"{object_name}_{object_id}_masked.mp4")
-        masked_frames_to_video(masked_frames_out_dir, vid_out_path, 20)
-
-        temp_dir.cleanup()
-        pbar.update(1)
+    # resolved once per video, a failing full resolution download is retried once and not for every object
+    video_paths = {video_id: find_video(video_id, in_dir) for video_id in data["id"].unique()}
+
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        futures = {}
+        for object_id, object_data in data.groupby("object_id"):
+            object_name = object_data["object_name"].iat[0]
+            video_path = video_paths[object_data["id"].iat[0]]
+            out_path = Path(uniquify(Path(out_dir, f"{object_name}_{object_id}_masked.mp4").as_posix()))
+            futures[executor.submit(write_masked_clip, video_path, out_path, object_data, color, fps)] = object_id
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures),
+                           desc="Extracting masked object clips"):
+            try:
+                future.result()
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                print(f"Error extracting the masked clip of {futures[future]}: {e}")
 
 
 def select_data_for_object_clip_extraction(
@@ -207,207 +294,156 @@ def merge_with_chromakey(in_dir: Path, out_dir: Path):
     subprocess.run(command) 
 
 
-def extract_frame(in_path: Path, out_dir: Path, timestamp: float, object_id: str, object_name: str) -> int:
-    out_path = out_dir / f"{object_name}_{object_id}_[{timestamp:1.3f}].jpg"
-    cmd = ["ffmpeg", "-y", "-ss", str(timestamp), "-i", in_path.as_posix(), "-vframes", "1",
-           "-q:v", "2", out_path.as_posix()]
-    operation = subprocess.run(
-        cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
-    )
-    return operation.returncode
+def crop_array(frame: np.ndarray, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+    """:return: the part of an rgb frame inside the box, a view of the frame"""
+    h, w = frame.shape[:2]
+    left, top, right, bottom = ensure_coords(left, top, right, bottom)
+    return frame[int(top * h):int(bottom * h), int(left * w):int(right * w)]
 
 
-def crop_frame(in_path: Path, out_dir: Path, left: float, top: float, right: float, bottom: float) -> None:
-    image = Image.open(in_path.as_posix())
-    w, h = image.size
-    left, top, right, bottom = ensure_coords(left, top, right, bottom)
-    left, top, right, bottom = (
-        int(left * w),
-        int(top * h),
-        int(right * w),
-        int(bottom * h),
-    )
-    image = image.crop((left, top, right, bottom))
-    out_path = out_dir / in_path.name
-    image.save(out_path.as_posix())
+def frame_crops(video_path: Path, out_dir: Path, video_data: pd.DataFrame) -> Iterator[Tuple[Path, np.ndarray]]:
+    """
+    Decodes every frame of a video needed by the data once and cuts the crops of all the objects seen in it
+    :param video_path: video the objects were tracked in
+    :param out_dir: directory of the thumbnails
+    :param video_data: object tracking rows of the video
+    :return: path and content of every thumbnail, as they are cut, not sharing memory with the frames
+    """
+    rows = video_data.groupby("time_seconds")
+    for timestamp, frame in read_frames(video_path, rows.groups.keys()):
+        for row in rows.get_group(timestamp).itertuples(index=False):
+            crop = crop_array(frame, row.left, row.top, row.right, row.bottom)
+            if crop.size:
+                # copied, a view would keep the whole frame in memory until the crop is encoded
+                yield out_dir / f"{row.object_name}_{row.object_id}_[{timestamp:.3f}].jpg", crop.copy()
+
+
+def save_video_thumbs(video_path: Path, out_dir: Path, video_data: pd.DataFrame,
+                      max_pending: int = MAX_PENDING_THUMBS) -> int:
+    """
+    Saves the thumbnails of the objects of a video, encoding the jpg files on a thread pool
+    :param max_pending: crops waiting to be encoded, decoding pauses when they are this many
+    :return: number of thumbnails saved
+    """
+    saved = 0
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        pending = set()
+        for out_path, crop in frame_crops(video_path, out_dir, video_data):
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                saved += len(done)
+            pending.add(executor.submit(Image.fromarray(crop).save, out_path, quality=95))
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
+        saved += len(pending)
+    return saved
 
 
 def extract_object_thumbs(in_dir: Path, out_dir: Path, data: pd.DataFrame):
     """
-    Extracts object thumbnails from the video frames.
-    :param in_dir:
-    :param out_dir:
-    :param data:
+    Extracts object thumbnails from the video frames. Every frame is decoded once, whatever the number of objects seen
+    in it, videos are processed in parallel on a process pool
+    :param in_dir: directory where the videos are stored
+    :param out_dir: directory where to save the thumbnails, named {object_name}_{object_id}_[{timestamp}].jpg
+    :param data: object tracking annotations
     :return:
     """
     out_dir.mkdir(parents=True, exist_ok=True)
-    video_groups = data.groupby("id")
-    commands = []
-
-    with tqdm(total=data.shape[0], desc="Building commands") as pbar:
-        for video_id, v_group in video_groups:
-            video_path = find_video_by_id(video_id, in_dir)
-            output = subprocess.check_output(["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height", "-of", "csv=s=x:p=0", video_path.as_posix()])
-            dimensions = re.search(r"([0-9]+)x([0-9]+)", output.decode("utf-8"))
-            w, h = int(dimensions.group(1)), int(dimensions.group(2))
-
-            label_groups = v_group.groupby("object_name")
-            for label_name, label_data in label_groups:
-                object_groups = label_data.groupby("object_id")
-                for object_id, object_data in object_groups:
-                    for _, row in object_data.iterrows():
-                        left, top, right, bottom = ensure_coords(row['left'], row['top'], row['right'], row['bottom'])
-                        left, top, right, bottom = int(left * w), int(top * h), int(right * w), int(bottom * h)
-                        out_path = out_dir / f"{label_name}_{object_id}_[{row['time_seconds']:.3f}].jpg"
-                        cmd = [ 
-                            "ffmpeg", "-y", "-ss", str(row['time_seconds']), "-i", video_path.as_posix(), "-vframes", "1",
-                            "-vf", f"crop={right - left}:{bottom - top}:{left}:{top}", "-q:v", "2", out_path.as_posix()
-                            ]
-                        commands.append(cmd)
-                        pbar.update(1)
-
-    with tqdm(total=len(commands), desc="Extracting object thumbnails") as pbar:
+
+    with tqdm(total=data["id"].nunique(), desc="Extracting object thumbnails", unit="video") as pbar:
         with concurrent.futures.ProcessPoolExecutor() as executor:
-            futures = [executor.submit(subprocess.run, cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for cmd in commands]
-            for _ in concurrent.futures.as_completed(futures):
-                pbar.update(1)
+            futures = {
+                executor.submit(save_video_thumbs, find_video_by_id(video_id, in_dir), out_dir, video_data): video_data
+                for video_id, video_data in data.groupby("id")
+            }
+            saved = 0
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    saved += future.result()
+                except (OSError, ValueError) as e:
+                    print(f"Error extracting the thumbnails of {futures[future]['id'].iat[0]}: {e}")
+                pbar.set_postfix(thumbnails=saved)
+                pbar.update()
+
+
+def normalise_crops(crops: List[np.ndarray]) -> np.ndarray:
+    """
+    Crops all the thumbnails of an object around their centre to the size of the smallest one, rounded down to even
+    and at least 2 pixels, thumbnails smaller than that are padded with black
+    :return: array of the thumbnails, shaped (frames, height, width, 3)
+    """
+    min_h = max(2, ensure_even(min(crop.shape[0] for crop in crops)))
+    min_w = max(2, ensure_even(min(crop.shape[1] for crop in crops)))
+    normalised = np.zeros((len(crops), min_h, min_w, 3), dtype=np.uint8)
+    for i, crop in enumerate(crops):
+        top, left = max(0, (crop.shape[0] - min_h) // 2), max(0, (crop.shape[1] - min_w) // 2)
+        crop = crop[top:top + min_h, left:left + min_w]
+        normalised[i, :crop.shape[0], :crop.shape[1]] = crop
+    return normalised
 
 
-def extract_obj_gifs(in_dir: Path, out_dir: Path, data: pd.DataFrame):
+def encode_animation(frames: np.ndarray, out_path: Path, fps: float) -> None:
     """
-    Extracts object gifs from the video frames.
-    :param in_dir:
-    :param out_dir:
-    :param data:
-    :return:
+    Encodes frames of the same size into an animation, piping them to ffmpeg
+    :param frames: array shaped (frames, height, width, 3)
+    :param out_path: path of the animation, its suffix is a key of ANIMATION_OPTIONS
+    :param fps: frame rate of the animation
     """
-    tmp_dir = tempfile.TemporaryDirectory()
-    executor = concurrent.futures.ProcessPoolExecutor()
-
-    out_dir.mkdir(parents=True, exist_ok=True)
-    pbar = tqdm(
-        total=len(data["object_id"].unique()), desc="Extracting object thumbnails", smoothing=0
-    )
+    _, h, w, _ = frames.shape
+    part_path = out_path.with_name(f"{out_path.stem}.part{out_path.suffix}")
+    cmd = ["ffmpeg", "-y", "-v", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}", "-framerate",
+           str(fps), "-i", "-", *ANIMATION_OPTIONS[out_path.suffix.lstrip(".")], part_path.as_posix()]
+    subprocess.run(cmd, input=frames.tobytes(), check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.replace(part_path, out_path)
 
-    object_groups = data.groupby("object_id")
 
-    for object_id in data["object_id"].unique():
-        object_data = object_groups.get_group(object_id)
-        object_name = object_data["object_name"].iat[0]
-    
-        video_path = find_video_by_id(object_data["id"].iat[0], in_dir)
-        timestamps = object_data["time_seconds"].to_numpy()
-
-        frame_path = Path(tmp_dir.name, 'frames')
-        thumb_path = Path(tmp_dir.name, 'thumbs')
-
-        frame_path.mkdir(parents=True, exist_ok=True)
-        thumb_path.mkdir(parents=True, exist_ok=True)
-
-        futures = [
-            executor.submit(extract_frame, video_path, frame_path, timestamp, object_id, object_name)
-            for timestamp in timestamps
-        ]
-        concurrent.futures.wait(futures)
-
-        for _, row in object_data.iterrows():
-            in_path = Path(
-                frame_path, f'{row["object_name"]}_{row["object_id"]}_[{row["time_seconds"]:1.3f}].jpg',
-            )
-            crop_frame(
-                in_path, thumb_path, row["left"], row["top"], row["right"], row["bottom"]
-            )
-            # make a list of thumbs with the same object_id and object_name
-            thumb_list = list(thumb_path.glob(f'{row["object_name"]}_{row["object_id"]}*.jpg'))
-            # sort the list by timestamp
-            thumb_list.sort(key=lambda x: float(x.stem.split('[')[-1].split(']')[0]))
-            # copy the files to another dir in the tmp dir and rename as object_id_0001.jpg, object_id_0002.jpg, etc.
-            Path(tmp_dir.name, 'renamed').mkdir(parents=True, exist_ok=True)
-            for i, thumb in enumerate(thumb_list):
-                shutil.copy(thumb, Path(tmp_dir.name, 'renamed', f'{row["object_id"]}_{i:04d}.jpg'))
-            # merge the renamed thumbs into a gif
-            subprocess.run(
-                ['ffmpeg', '-framerate', '12', '-i', f'{tmp_dir.name}/renamed/{row["object_id"]}_%04d.jpg', '-y',
-                 f'{out_dir}/{row["object_id"]}.gif'],
-                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        pbar.update(1)
-
-
-def extract_obj_gifs_parallel(in_dir: Path, out_dir: Path, data: pd.DataFrame):
+def write_object_animation(video_path: Path, out_path: Path, object_data: pd.DataFrame, fps: float) -> Path:
+    """
+    Builds the animation of an object from its crops, kept in memory from decoding to encoding
+    :param video_path: video the object was tracked in
+    :param out_path: path of the animation
+    :param object_data: tracking rows of the object, one frame of the animation per timestamp
+    :param fps: frame rate of the animation
+    :return: path of the animation
     """
-    Extracts object gifs from the video frames.
-    :param in_dir:
-    :param out_dir:
-    :param data:
+    boxes = object_data.drop_duplicates("time_seconds").set_index("time_seconds")[BOX_COLUMNS]
+    # copied, a view would keep its whole frame in memory until the animation is encoded
+    crops = [crop.copy() for crop in (crop_array(frame, *boxes.loc[timestamp])
+                                      for timestamp, frame in read_frames(video_path, boxes.index)) if crop.size]
+    if not crops:
+        raise ValueError(f"no frames of {video_path.name} at the tracked timestamps")
+    encode_animation(normalise_crops(crops), out_path, fps)
+    return out_path
+
+
+def extract_object_animations(in_dir: Path, out_dir: Path, data: pd.DataFrame, fmt: str = "gif",
+                              fps: float = ANIMATION_FPS):
+    """
+    Extracts an animated thumbnail of each object from the video frames. Objects are processed in parallel on a
+    process pool, each one in the memory of its own worker
+    :param in_dir: directory where the videos are stored
+    :param out_dir: directory where to save the animations, named {object_id}.{fmt}
+    :param data: object tracking annotations
+    :param fmt: gif, webp or mp4
+    :param fps: frame rate of the animations
     :return:
     """
-    tmp_dir = tempfile.TemporaryDirectory()
     out_dir.mkdir(parents=True, exist_ok=True)
-    executor = concurrent.futures.ProcessPoolExecutor()
-    pbar = tqdm(
-        total=len(data["object_id"].unique()), desc="Extracting object gifs", smoothing=0
-    )
-
-    object_groups = data.groupby("object_id")
 
-    for object_id in data["object_id"].unique():
-        object_data = object_groups.get_group(object_id)
-        object_name = object_data["object_name"].iat[0]
-        object_id = object_data["object_id"].iat[0]
-        video_path = find_video_by_id(object_data["id"].iat[0], in_dir)
-        timestamps = object_data["time_seconds"].to_numpy()
-
-        frame_path = Path(tmp_dir.name, 'frames')
-        thumb_path = Path(tmp_dir.name, 'thumbs')
-
-        frame_path.mkdir(parents=True, exist_ok=True)
-        thumb_path.mkdir(parents=True, exist_ok=True)
-
-        futures = [
-            executor.submit(extract_frame, video_path, frame_path, timestamp, object_id, object_name)
-            for timestamp in timestamps
-        ]
-        concurrent.futures.wait(futures)
-
-        futures = [
-            executor.submit(
-                crop_frame,
-                Path(frame_path, f'{row["object_name"]}_{row["object_id"]}_[{row["time_seconds"]:1.3f}].jpg'),
-                thumb_path,
-                row["left"],
-                row["top"],
-                row["right"],
-                row["bottom"],
-            )
-            for _, row in object_data.iterrows()
-        ]
-        concurrent.futures.wait(futures)
-
-        size_data = get_min_thumbs_size_data(thumb_path)
-        crop_thumbs_to_normalised_size(thumb_path, thumb_path, size_data)
-
-        futures = [
-            executor.submit(
-                merge_to_gif, out_dir, row, thumb_path, tmp_dir
-            ) for _, row in object_data.iterrows()
-        ]
-        concurrent.futures.wait(futures)
-
-        subprocess.run(
-            ['ffmpeg', '-framerate', '12', '-i', f'{tmp_dir.name}/renamed/{object_id}_%04d.jpg', '-y',
-             f'{out_dir}/{object_id}.gif'],
-            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        pbar.update(1)
-
-
-def merge_to_gif(out_dir, row, thumb_path, tmp_dir):
-    thumb_list = list(thumb_path.glob(f'{row["object_name"]}_{row["object_id"]}*.jpg'))
-    # sort the list by timestamp
-    thumb_list.sort(key=lambda x: float(x.stem.split('[')[-1].split(']')[0]))
-    # copy the files to another dir in the tmp dir and rename as object_id_0001.jpg, object_id_0002.jpg, etc.
-    Path(tmp_dir.name, 'renamed').mkdir(parents=True, exist_ok=True)
-    for i, thumb in enumerate(thumb_list):
-        shutil.copy(thumb, Path(tmp_dir.name, 'renamed', f'{row["object_id"]}_{i:04d}.jpg'))
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        futures = {
+            executor.submit(write_object_animation, find_video_by_id(object_data["id"].iat[0], in_dir),
+                            out_dir / f"{object_id}.{fmt}", object_data, fps): object_id
+            for object_id, object_data in data.groupby("object_id")
+        }
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures),
+                           desc=f"Extracting object {fmt} animations", smoothing=0):
+            try:
+                future.result()
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                print(f"Error extracting the animation of {futures[future]}: {e}")
 
 
 def reject_outliers(data, m=2.0) -> List[int]:
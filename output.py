@@ -9,13 +9,15 @@ import pandas as pd
 from matplotlib import pyplot as plt
 from tqdm import tqdm
 
+from catalog import get_catalog
+from download import find_full_video_by_id
 from metavideo import get_metagrid
 from object_tracking_operations import (extract_masked_object_clips,
-                                        extract_obj_gifs_parallel,
+                                        extract_object_animations,
                                         extract_object_thumbs,
                                         interpolate_missing_data,
                                         merge_with_chromakey)
-from utils import ensure_coords, ensure_dir, find_video_by_id, uniquify
+from utils import ensure_coords, ensure_dir, uniquify
 
 
 def select_shots_by_entity(annotation_data: pd.DataFrame,
@@ -209,11 +211,13 @@ def extract_shots(_df: pd.DataFrame, in_dir: Path, out_dir: Path, text: str = Fa
     """
     df = _df.sort_values(by=['id', 'start_sec'])
     out_dir.mkdir(parents=True, exist_ok=True)
+    # resolved once per video, a failing full resolution download is retried once and not for every shot
+    video_paths = {video_id: find_full_video_by_id(video_id, in_dir) for video_id in df['id'].unique()}
 
     for index, row in tqdm(df.iterrows(), total=df.shape[0], desc='Extracting shots'):
         entity = row[text] if text else row[0]
         video_id = row['id']
-        filename = Path(in_dir, find_video_by_id(row['id'], in_dir))
+        filename = video_paths[video_id]
         start = "%.2f" % row['start_sec']
         end = "%.2f" % row['end_sec']
         if start == end:
@@ -248,15 +252,9 @@ def merge_shots(in_dir: Path, out_dir: Path):
     :return: None
     """
     out_dir.mkdir(parents=True, exist_ok=True)
-    files = [file.as_posix() for file in in_dir.glob('*.mp4')]
     # select only files have an audio and a video stream
-    files = [file for file in files if len(subprocess.run(
-        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_type", "-of",
-         "default=noprint_wrappers=1:nokey=1", file],
-        stdout=subprocess.PIPE).stdout.decode('utf-8').splitlines()) > 0 and len(subprocess.run(
-        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=codec_type", "-of",
-         "default=noprint_wrappers=1:nokey=1", file],
-        stdout=subprocess.PIPE).stdout.decode('utf-8').splitlines()) > 0]
+    files = [(in_dir / video['path']).as_posix() for video in get_catalog(in_dir).all_info()
+             if video['audio_codec'] and video['video_codec']]
     files.sort()
 
     out_path = uniquify(Path(out_dir, 'merged.mp4').as_posix())
@@ -397,7 +395,7 @@ def extract_object_thumbnails(in_dir: Path, out_dir: Path, data: pd.DataFrame, k
     return None
 
 
-def extract_object_gifs(in_dir: Path, out_dir: Path, data: pd.DataFrame, key: list) -> None:
+def extract_object_gifs(in_dir: Path, out_dir: Path, data: pd.DataFrame, key: list, fmt: str = 'gif') -> None:
     """
     Given a video and a dataframe with object tracking annotations extracts gifs of selected the objects
     :rtype: None
@@ -405,11 +403,12 @@ def extract_object_gifs(in_dir: Path, out_dir: Path, data: pd.DataFrame, key: li
     :param in_dir: directory where the source video is stored
     :param out_dir: directory where to save the thumbnails
     :param data: dataframe with object tracking annotations
+    :param fmt: gif, webp or mp4
     :return: None
     """
     data = data[data['object_name'].isin(key)]
     data = interpolate_missing_data(data)
-    extract_obj_gifs_parallel(in_dir, out_dir, data)
+    extract_object_animations(in_dir, out_dir, data, fmt)
     return None
 
 
@@ -424,7 +423,7 @@ def extract_masked_clips(in_dir: Path, out_dir: Path, data: pd.DataFrame, key: l
     """
     data = data[data['object_name'].isin(key)]
     data = interpolate_missing_data(data)
-    extract_masked_object_clips(in_dir, out_dir, data)
+    extract_masked_object_clips(in_dir, out_dir, data, full_resolution=True)
 
 
 def extract_object_metavideo(in_dir: Path, out_dir: Path, data: pd.DataFrame, key: list) -> None:
@@ -439,7 +438,7 @@ def extract_object_metavideo(in_dir: Path, out_dir: Path, data: pd.DataFrame, ke
     data = data[data['object_name'].isin(key)]
     data = interpolate_missing_data(data)
     temp_dir = tempfile.TemporaryDirectory()
-    extract_masked_object_clips(in_dir, Path(temp_dir.name), data, color=(0, 255, 0, 0))
+    extract_masked_object_clips(in_dir, Path(temp_dir.name), data, full_resolution=True, color=(0, 255, 0, 0))
     merge_with_chromakey(Path(temp_dir.name), out_dir)
 
 
@@ -1,40 +1,173 @@
+import concurrent.futures
+import functools
 import json
-import re
+import threading
 from datetime import timedelta
+from json.decoder import WHITESPACE
+from typing import Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
 
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-import pprint
+from requests.adapters import HTTPAdapter
+
+from api_cache import get_api_cache
+from scheduler import retry_with_backoff
+
+WATCH_URL = 'https://www.youtube.com/watch?v={}'
+MAX_WORKERS = 8
+MAX_PER_HOST = 4
+REQUEST_TIMEOUT = (5, 30)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+HEATMARKER_COLUMNS = ['id', 'segment', 'start_sec', 'end_sec', 'score']
+INITIAL_DATA_MARKERS = ['var ytInitialData = ', 'window["ytInitialData"] = ', 'ytInitialData = ']
+MARKERS_MAP_KEY = '"markersMap":'
+
+_decoder = json.JSONDecoder()
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
 
 def format_time(in_time):
     return str(timedelta(seconds=in_time / 1000))
 
 
+@functools.lru_cache(maxsize=None)
+def get_session() -> requests.Session:
+    """Session shared by all the fetches, so connections to the same host are kept alive and reused"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+    session.mount('https://', adapter)
+    return session
+
+
+def host_slot(url: str) -> threading.BoundedSemaphore:
+    """:return: semaphore limiting the concurrent requests to the host of the url"""
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _host_slots[host]
+
+
+def fetch_page(url: str) -> str:
+    """Fetches a page with the shared session, raising on the status codes worth retrying"""
+    with host_slot(url):
+        response = get_session().get(url, timeout=REQUEST_TIMEOUT)
+    if response.status_code in RETRY_STATUS:
+        response.raise_for_status()
+    return response.text
+
+
 def get_playback_heatmarkers(video_index):
-    r = requests.get(f'https://www.youtube.com/watch?v={video_index}')
-    b = BeautifulSoup(r.text, 'html.parser')
+    return parse_heatmarkers(video_index, fetch_page(WATCH_URL.format(video_index)))
+
+
+def find_initial_data(html: str) -> int:
+    """:return: index of the opening brace of the ytInitialData object in a watch page, -1 if it is not there"""
+    for marker in INITIAL_DATA_MARKERS:
+        index = html.find(marker)
+        if index != -1:
+            return html.find('{', index + len(marker))
+    return -1
+
+
+def markers_map(html: str, start: int) -> Optional[list]:
+    """
+    Decodes only the markersMap array of ytInitialData, instead of the whole object
+    :param start: index of the opening brace of ytInitialData
+    """
+    index = html.find(MARKERS_MAP_KEY, start)
+    if index == -1:
+        return None
+    try:
+        value, _ = _decoder.raw_decode(html, WHITESPACE.match(html, index + len(MARKERS_MAP_KEY)).end())
+    except json.JSONDecodeError:
+        return None
+    return value if isinstance(value, list) else None
+
+
+def find_heatmaps(markers: list) -> list:
+    """:return: heatmap of every marker of a markersMap that has one"""
+    return [marker['value']['heatmap'] for marker in markers
+            if isinstance(marker, dict) and 'heatmap' in marker.get('value', {})]
+
+
+def parse_heatmarkers(video_index, html: str) -> Optional[pd.DataFrame]:
+    """
+    Extracts the heatmarkers from a watch page without building the HTML tree: the JSON decoder starts right at
+    the markersMap of ytInitialData and stops at its end. If that markersMap has no heatmap, the ytInitialData
+    object alone is decoded and the markersMap of the player bar is read
+    :return: dataframe of heatmarkers, None if the video has none
+    """
+    start = find_initial_data(html)
+    if start == -1:
+        print(f'The watch page of "{video_index}" has no ytInitialData')
+        return None
+
+    heatmaps = find_heatmaps(markers_map(html, start) or [])
+    if not heatmaps:
+        # the first markersMap of the page may be another one, like the chapters
+        try:
+            initial_data, _ = _decoder.raw_decode(html, start)
+            heatmaps = find_heatmaps(initial_data['playerOverlays']['playerOverlayRenderer'][
+                'decoratedPlayerBarRenderer']['decoratedPlayerBarRenderer']['playerBar'][
+                'multiMarkersPlayerBarRenderer']['markersMap'])
+        except (json.JSONDecodeError, KeyError, TypeError):
+            heatmaps = []
+    if not heatmaps:
+        print(f'The video "{video_index}" has no playback heatmarkers')
+        return None
+
+    heatmarkers = []
+    for i, item in enumerate(heatmaps[-1]['heatmapRenderer']['heatMarkers']):
+        start_millis = item['heatMarkerRenderer']['timeRangeStartMillis']
+        duration = item['heatMarkerRenderer']['markerDurationMillis']
+        score = item['heatMarkerRenderer']['heatMarkerIntensityScoreNormalized']
+        start_sec = float(start_millis / 1000)
+        end_sec = float((start_millis + duration) / 1000)
+
+        heatmarkers.append([video_index, i, start_sec, end_sec, score])
+
+    return pd.DataFrame(heatmarkers, columns=HEATMARKER_COLUMNS)
+
+
+def cached_heatmarkers(video_id: str) -> Optional[pd.DataFrame]:
+    """
+    Heatmarkers of a video, served from the cache while fresh, otherwise fetched with retries and cached. Videos
+    without heatmarkers are cached apart, for the shorter heatmarkers_missing TTL, and errors are not cached
+    :return: dataframe of heatmarkers, None if the video has none
+    """
+    cache = get_api_cache()
+    key, missing_key = f'heatmarkers:{video_id}', f'heatmarkers_missing:{video_id}'
+    body, _, fresh = cache.get_response(key, 'heatmarkers')
+    if fresh:
+        return pd.DataFrame(body['heatmarkers'], columns=HEATMARKER_COLUMNS)
+    _, _, missing = cache.get_response(missing_key, 'heatmarkers_missing')
+    if missing:
+        return None
+
+    heatmarkers = retry_with_backoff(get_playback_heatmarkers, video_id,
+                                     retry_on=(requests.ConnectionError, requests.Timeout, requests.HTTPError))
+    if heatmarkers is None:
+        cache.put_response(missing_key, {})
+    else:
+        cache.put_response(key, {'heatmarkers': heatmarkers.to_dict('records')})
+    return heatmarkers
 
-    for script in b.find_all('script'):
-        if script.text.startswith('var ytInitialData'):
-            response_json = re.sub(r'^.*?{', '{', script.text).replace(';', '')
-            response_dict = json.loads(response_json)
-            
 
+def fetch_heatmarkers(video_ids: Iterable[str],
+                      max_workers: int = MAX_WORKERS) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+    """
+    Fetches the heatmarkers of many videos concurrently
+    :return: video id and heatmarkers of every video, as they arrive
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(cached_heatmarkers, video_id): video_id for video_id in video_ids}
+        for future in concurrent.futures.as_completed(futures):
             try:
-                overlays = response_dict['playerOverlays']['playerOverlayRenderer']['decoratedPlayerBarRenderer']['decoratedPlayerBarRenderer']['playerBar']['multiMarkersPlayerBarRenderer']['markersMap'][-1]['value']['heatmap']['heatmapRenderer']['heatMarkers']
-            except KeyError:
-                print(f'The video "{b.title.text}" has no playback heatmarkers')
-                break
-
-            heatmarkers = []
-            for i,item in enumerate(overlays):
-                start_millis = item['heatMarkerRenderer']['timeRangeStartMillis']
-                duration = item['heatMarkerRenderer']['markerDurationMillis']
-                score = item['heatMarkerRenderer']['heatMarkerIntensityScoreNormalized']
-                start = float(start_millis / 1000)
-                end = float((start_millis + duration) / 1000)
-
-                heatmarkers.append([video_index, i, start, end, score])
-
-            return pd.DataFrame(heatmarkers, columns=['id', 'segment', 'start_sec', 'end_sec', 'score'])
+                yield futures[future], future.result()
+            except (requests.RequestException, KeyError, TypeError, ValueError) as e:
+                # a failed request or a page not shaped as expected only loses that video
+                print(f"Error getting playback data for {futures[future]}: {e!r}")
@@ -3,16 +3,28 @@ from pathlib import Path
 from typing import List
 
 import enquiries
-import pandas as pd
-
-import analysis
-import download
-import output
-from itematlas import serve_itematlas
-from momentmap import serve_momentmap
-from reelchart import serve_reelchart
+
 from utils import parse_id
 
+# Modules that build API clients, load models or pull in heavy libraries are imported by the handlers that
+# need them, so that startup stays fast and the menus work without credentials
+
+DOWNLOAD_PROFILES = {
+    'Analysis proxy (low resolution, full resolution fetched when an edit needs it)': 'proxy',
+    'Full resolution': 'full',
+}
+
+LOCAL_SHOT_DETECTION = 'Shot Change Detection (local, no upload)'
+ALL_VIDEOS = 'All annotated videos'
+
+ANALYSES = {
+    'Label Detection': 'label_detection',
+    'Frame Label Detection': 'frame_label_detection',
+    'Transcription': 'transcription',
+    'Object Tracking': 'object_tracking',
+    'Shot Change Detection': 'shot_change_detection',
+}
+
 
 def ensure_mismas() -> Path:
     home_dir = Path.home()
@@ -56,10 +68,19 @@ def project_dir_handler(mismas_dir: Path) -> Path:
 
 
 def find_channel_uploads() -> List[str]:
+    import download
     channel_name = input('Enter channel name: ')
     channel_id = download.search_channel_id(channel_name)
-    upload_playlist_id = download.get_uploads_playlist_id(channel_id)
-    return download.get_video_ids_from_playlist(upload_playlist_id)
+    return download.get_video_ids_from_channels([channel_id]).get(channel_id, [])
+
+
+def crawl_from_txt(project_dir: Path) -> List[str]:
+    import download
+    txt_path = download.find_txt_files(project_dir, 'Select file with playlists or channels')
+    playlist_ids, channel_ids = download.split_playlists_and_channels(download.parse_txt(txt_path))
+    results = {**download.get_video_ids_from_playlists(playlist_ids),
+               **download.get_video_ids_from_channels(channel_ids)}
+    return list(dict.fromkeys(video_id for ids in results.values() for video_id in ids))
 
 
 def get_id_from_input() -> str:
@@ -68,11 +89,14 @@ def get_id_from_input() -> str:
 
 
 def yt_video_selector(project_dir: Path) -> List[str]:
+    import download
+    import pandas as pd
     choice = enquiries.choose(prompt='How do you want to select videos?',
                               choices=['Video id or URL',
                                        'Playlist id or URL',
                                        'Search for channel name',
-                                       'Load from file'])
+                                       'Load from file',
+                                       'Crawl playlists and channels from txt file'])
 
     if choice == 'Video id or URL':
         ids = get_id_from_input()
@@ -86,11 +110,14 @@ def yt_video_selector(project_dir: Path) -> List[str]:
         file_path = enquiries.choose(prompt='Select file', choices=[f.name for f in Path(project_dir).glob('*.csv')])
         video_df = pd.read_csv(Path(project_dir, file_path).as_posix())
         video_ids = video_df['id'].tolist()
+    elif choice == 'Crawl playlists and channels from txt file':
+        video_ids = crawl_from_txt(project_dir)
 
     return video_ids
 
 
 def local_video_selector(project_dir: Path) -> list:
+    import pandas as pd
     choice = enquiries.choose(prompt='Do you want select manually or load from file? \n'
                                      'File must be *.csv containing a column named "id"',
                               choices=['Select Manually', 'Load from file'])
@@ -111,49 +138,76 @@ def local_video_selector(project_dir: Path) -> list:
 
 
 def analysis_handler(project_dir: Path) -> None:
+    import analysis
     Path(project_dir, 'data').mkdir(exist_ok=True)
     video_ids = local_video_selector(project_dir)
-    choice = enquiries.choose(prompt='What do you want to do?',
-                              choices=['Label Detection',
-                                       'Frame Label Detection',
-                                       'Transcription',
-                                       'Object Tracking',
-                                       'Shot Change Detection',
-                                       'Youtube Playback Data'])
-
-    if choice == 'Label Detection':
-        analysis.batch_annotate_from_ids(video_ids, 'label_detection', project_dir)
-    elif choice == 'Frame Label Detection':
-        analysis.batch_annotate_from_ids(video_ids, 'frame_label_detection', project_dir)
-    elif choice == 'Transcription':
-        analysis.batch_annotate_from_ids(video_ids, 'transcription', project_dir)
-    elif choice == 'Object Tracking':
-        analysis.batch_annotate_from_ids(video_ids, 'object_tracking', project_dir)
-    elif choice == 'Shot Change Detection':
-        analysis.batch_annotate_from_ids(video_ids, 'shot_change_detection', project_dir)
-    elif choice == 'Youtube Playback Data':
+    choices = enquiries.choose(prompt='What do you want to do? (selected analyses share one request per video)',
+                               choices=list(ANALYSES) + [LOCAL_SHOT_DETECTION, 'Youtube Playback Data'], multi=True)
+
+    features = [ANALYSES[choice] for choice in choices if choice in ANALYSES]
+    if features:
+        use_proxies = enquiries.confirm(prompt='Upload low resolution proxies instead of the original videos?')
+        segment_minutes = input('Annotate long videos in parallel segments of how many minutes? '
+                                '(leave empty to annotate whole videos): ')
+        analysis.batch_annotate_features(video_ids, features, project_dir, use_proxies=use_proxies,
+                                         segment_seconds=float(segment_minutes) * 60 if segment_minutes else None)
+    if LOCAL_SHOT_DETECTION in choices:
+        from shot_detection import batch_detect_shots
+        batch_detect_shots(video_ids, project_dir)
+    if 'Youtube Playback Data' in choices:
         analysis.most_replayed(video_ids, project_dir)
 
 
 
 def report_handler(project_dir: Path) -> None:
+    import download
     video_ids = yt_video_selector(project_dir)
-    report = download.compile_videos_report(video_ids)
-    report.to_csv(Path(project_dir, 'youtube_report.csv').as_posix(), index=False)
-    print('Report saved to: ', Path(project_dir, 'youtube_report.csv').as_posix())
+    report_path = Path(project_dir, 'youtube_report.csv')
+    download.compile_videos_report(video_ids, report_path)
+    print('Report saved to: ', report_path.as_posix())
 
 
 def download_handler(project_dir: Path) -> None:
+    import download
     download_folder = Path(project_dir, 'download')
     download_folder.mkdir(exist_ok=True)
     video_ids = yt_video_selector(project_dir)
-    download.download_videos(video_ids, download_folder)
+    profile = enquiries.choose(prompt='Select download profile', choices=list(DOWNLOAD_PROFILES), multi=False)
+    bandwidth_limit = input('Bandwidth cap in MB/s (leave empty for no cap): ')
+    download.download_videos(video_ids, download_folder, float(bandwidth_limit) if bandwidth_limit else None,
+                             DOWNLOAD_PROFILES[profile])
     print('Videos saved to: ', download_folder.as_posix())
 
 
+def choose_object_tracking_data(project_dir: Path):
+    """
+    Asks for the object tracking annotations to use, those of all the annotated videos or of a single one
+    :param project_dir: main directory of the project
+    :return: dataframe of object tracking annotations
+    """
+    import pandas as pd
+
+    from dataset import read_annotations
+
+    data_dir = Path(project_dir, 'data', 'object_tracking')
+    choice = enquiries.choose(prompt='Select file with object tracking annotations', multi=False,
+                              choices=[ALL_VIDEOS] + sorted(path.name for path in data_dir.glob('*.csv')))
+    if choice == ALL_VIDEOS:
+        return read_annotations(project_dir, 'object_tracking')
+    return pd.read_csv(data_dir / choice)
+
+
 ## TODO: Ask god forgiveness for this abomination
 
 def edit_handler(project_dir: Path) -> None:
+    import pandas as pd
+
+    import output
+    from dataset import read_annotations
+    from itematlas import serve_itematlas
+    from momentmap import serve_momentmap
+    from reelchart import serve_reelchart
+
     choice = enquiries.choose(prompt='What do you want to do?',
                               choices=['Extract Shots',
                                        'Merge Shots',
@@ -176,11 +230,15 @@ def edit_handler(project_dir: Path) -> None:
                                             multi=False)
 
         data_path_file = enquiries.choose(prompt='Load file with shot data',
-                                          choices=[path.name for path in Path(data_path_parent).glob('*.csv')],
+                                          choices=[ALL_VIDEOS] + [path.name for path in
+                                                                  Path(data_path_parent).glob('*.csv')],
                                           multi=False)
 
         data_path = Path(project_dir, 'data', data_path_parent, data_path_file)
-        data = pd.read_csv(data_path)
+        if data_path_file == ALL_VIDEOS:
+            data = read_annotations(project_dir, data_path.parent.name)
+        else:
+            data = pd.read_csv(data_path)
         shot_data = data
         if enquiries.confirm(prompt='Do you want to select shots?'):
             if data_path.parent.name == 'label_detection':
@@ -249,10 +307,7 @@ def edit_handler(project_dir: Path) -> None:
         output.merge_shots(in_dir, out_dir)
 
     elif choice == 'Render Heatmap':
-        data_path = enquiries.choose(prompt='Select file with object tracking annotations',
-                                     choices=Path(project_dir, 'data', 'object_tracking').rglob('*.csv'),
-                                     multi=False)
-        data = pd.read_csv(data_path)
+        data = choose_object_tracking_data(project_dir)
         key = enquiries.choose(prompt='Select object to extract', multi=True,
                                choices=data['object_name'].value_counts().sort_values(ascending=False).index.tolist())
         out_dir = project_dir / 'traces'
@@ -260,10 +315,7 @@ def edit_handler(project_dir: Path) -> None:
         output.render_heatmap(out_dir, data, key)
 
     elif choice == 'Render Traces':
-        data_path = enquiries.choose(prompt='Select file with object tracking annotations',
-                                        choices=Path(project_dir, 'data', 'object_tracking').rglob('*.csv'),
-                                        multi=False)
-        data = pd.read_csv(data_path)
+        data = choose_object_tracking_data(project_dir)
         key = enquiries.choose(prompt='Select object to track', multi=True,
                                  choices=data['object_name'].value_counts().sort_values(ascending=False).index.tolist())
         out_dir = project_dir / 'traces'
@@ -271,10 +323,7 @@ def edit_handler(project_dir: Path) -> None:
         output.render_traces(out_dir, data, key)
 
     elif choice == 'Extract Object Thumbnails':
-        data_path = enquiries.choose(prompt='Select file with object tracking annotations',
-                                     choices=Path(project_dir, 'data', 'object_tracking').rglob('*.csv'),
-                                     multi=False)
-        data = pd.read_csv(data_path)
+        data = choose_object_tracking_data(project_dir)
         key = enquiries.choose(prompt='Select object to extract', multi=True,
                                choices=data['object_name'].value_counts().sort_values(ascending=False).index.tolist())
         in_dir = project_dir / 'download'
@@ -283,10 +332,7 @@ def edit_handler(project_dir: Path) -> None:
         output.extract_object_thumbnails(in_dir, out_dir, data, key)
 
     elif choice == 'Extract Object Gifs':
-        data_path = enquiries.choose(prompt='Select file with object tracking annotations',
-                                     choices=Path(project_dir, 'data', 'object_tracking').rglob('*.csv'),
-                                     multi=False)
-        data = pd.read_csv(data_path)
+        data = choose_object_tracking_data(project_dir)
         key = enquiries.choose(prompt='Select object to extract', multi=True,
                                choices=data['object_name'].value_counts().sort_values(ascending=False).index.tolist())
         in_dir = project_dir / 'download'
@@ -295,13 +341,7 @@ def edit_handler(project_dir: Path) -> None:
         output.extract_object_gifs(in_dir, out_dir, data, key)
 
     elif choice == 'Extract Masked Clips':
-        data_path = enquiries.choose(prompt='Select file with object tracking annotations', multi=False,
-                                     choices=[file.name for file in
-                                              Path(project_dir, 'data', 'object_tracking').rglob('*.csv')]
-                                     )
-
-        data_path = Path(project_dir, 'data', 'object_tracking', data_path)
-        data = pd.read_csv(data_path)
+        data = choose_object_tracking_data(project_dir)
         key = enquiries.choose(prompt='Select objects to extract', multi=True,
                                choices=data['object_name'].value_counts().sort_values(ascending=False).index.to_list())
         in_dir = project_dir / 'download'
@@ -310,10 +350,7 @@ def edit_handler(project_dir: Path) -> None:
         output.extract_masked_clips(in_dir, out_dir, data, key)
 
     elif choice == 'Generate Object Tracking Metavideo':
-        data_path = enquiries.choose(prompt='Select file with object tracking annotations',
-                                     choices=Path(project_dir, 'data', 'object_tracking').rglob('*.csv'),
-                                     multi=False)
-        data = pd.read_csv(data_path)
+        data = choose_object_tracking_data(project_dir)
         key = enquiries.choose(prompt='Select objects to extract', multi=True,
                                choices=data['object_name'].value_counts().sort_values(ascending=False).index.to_list())
         in_dir = project_dir / 'download'
@@ -322,10 +359,7 @@ def edit_handler(project_dir: Path) -> None:
         output.extract_object_metavideo(in_dir, out_dir, data, key)
 
     elif choice == 'Generate Object Tracking Mosaic':
-        data_path = enquiries.choose(prompt='Select file with object tracking annotations',
-                                     choices=Path(project_dir, 'data', 'object_tracking').rglob('*.csv'),
-                                     multi=False)
-        data = pd.read_csv(data_path)
+        data = choose_object_tracking_data(project_dir)
         key = enquiries.choose(prompt='Select objects to extract', multi=True,
                                choices=data['object_name'].value_counts().sort_values(ascending=False).index.to_list())
         in_dir = project_dir / 'download'
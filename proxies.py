@@ -0,0 +1,76 @@
+import concurrent.futures
+import os
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from tqdm import tqdm
+
+PROXY_HEIGHT = 360
+# keeps every frame at its original timestamp, so time offsets found in a proxy hold for the original
+KEEP_TIMESTAMPS = ['-map_metadata', '-1', '-vsync', 'passthrough']
+VIDEO_OPTIONS = ['-vf', f'scale=-2:{PROXY_HEIGHT}', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28']
+AUDIO_OPTIONS = ['-ac', '1', '-ar', '16000', '-c:a', 'aac', '-b:a', '48k']
+# scaling keeps the aspect ratio and nothing is cropped, so normalized coordinates hold for the original too
+PROXY_OPTIONS = {
+    'audio': ['-map', '0:a:0', '-vn', *AUDIO_OPTIONS],
+    'video': ['-map', '0:v:0', '-an', *VIDEO_OPTIONS],
+    'video_audio': ['-map', '0:v:0', '-map', '0:a:0?', *VIDEO_OPTIONS, *AUDIO_OPTIONS],
+}
+
+
+def proxy_profile(features: Iterable[str]) -> str:
+    """
+    :param features: services the proxy is uploaded for
+    :return: audio only for transcription alone, low resolution video otherwise, with audio if transcription is
+    also requested
+    """
+    features = set(features)
+    if features == {'transcription'}:
+        return 'audio'
+    return 'video_audio' if 'transcription' in features else 'video'
+
+
+def proxy_path(path: Path, profile: str, proxy_dir: Path) -> Path:
+    return proxy_dir / profile / path.name
+
+
+def build_proxy(path: Path, profile: str, proxy_dir: Path) -> Path:
+    """
+    Transcodes a video for upload, unless a proxy newer than the video is already cached
+    :param path: original video
+    :param profile: key of PROXY_OPTIONS
+    :param proxy_dir: cache directory, proxies are kept in a subdirectory per profile
+    :return: path of the proxy, named like the original
+    """
+    out_path = proxy_path(path, profile, proxy_dir)
+    if out_path.is_file() and out_path.stat().st_mtime >= path.stat().st_mtime:
+        return out_path
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = out_path.with_name(f'{out_path.stem}.part{out_path.suffix}')
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', path.as_posix(), *PROXY_OPTIONS[profile], *KEEP_TIMESTAMPS,
+                    '-movflags', '+faststart', part_path.as_posix()],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.replace(part_path, out_path)
+    return out_path
+
+
+def build_proxies(profiles: Dict[Path, str], proxy_dir: Path, max_workers: Optional[int] = None) -> Dict[Path, Path]:
+    """
+    Builds the proxies of many videos with a pool of ffmpeg processes
+    :param profiles: profile of the proxy to build for each video
+    :param proxy_dir: cache directory
+    :param max_workers: number of concurrent ffmpeg processes, defaults to the number of CPUs
+    :return: proxy of each video, videos that failed to transcode map to themselves so they are uploaded as they are
+    """
+    proxies = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = {executor.submit(build_proxy, path, profile, proxy_dir): path for path, profile in profiles.items()}
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc='Building proxies'):
+            path = futures[future]
+            try:
+                proxies[path] = future.result()
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"Error building the proxy of {path.name}, uploading the original: {e}")
+                proxies[path] = path
+    return proxies
@@ -1,23 +1,26 @@
 import concurrent.futures
+import functools
 import re
 import subprocess
 from pathlib import Path
 import os
 import pandas as pd
-import spacy
 from tqdm import tqdm
 
-import analysis
+from dataset import read_annotations
 from utils import copy_visualiser_dir, find_video_by_id, serve_directory
 
-try:
-    spacy.load('en_core_web_trf')
-except OSError:
-    subprocess.run(['venv/bin/python', '-m', 'spacy', 'download', 'en_core_web_trf'])
-    os.system('cls' if os.name == 'nt' else 'clear')
 
-en = spacy.load("en_core_web_trf")
-stopwords = en.Defaults.stop_words
+@functools.lru_cache(maxsize=None)
+def get_nlp():
+    """Loads the spaCy model on first use, downloading it if it is not installed yet"""
+    import spacy
+    try:
+        return spacy.load('en_core_web_trf')
+    except OSError:
+        subprocess.run(['venv/bin/python', '-m', 'spacy', 'download', 'en_core_web_trf'])
+        os.system('cls' if os.name == 'nt' else 'clear')
+    return spacy.load("en_core_web_trf")
 
 ## TODO: Fix this, if i do i'll probably be able to rid of the trf model and go back to web_sm
 ## Big issue here is that we need a complete continuous text to get good results
@@ -81,10 +84,11 @@ def extract_reelchart_frames(data: pd.DataFrame, project_dir: Path, segments=20)
 def process_word(word: str) -> str:
     if not word:
         return ""
-    doc = en(word)
+    nlp = get_nlp()
+    doc = nlp(word)
     if doc[0].pos_ != "PROPN":
         word = doc[0].lemma_
-    if word in stopwords:
+    if word in nlp.Defaults.stop_words:
         return ""
     word = re.sub(r"[.,?!;:]", "", word.lower())
     return "" if word == "i" else word
@@ -146,18 +150,16 @@ def make_reelchart_table_with_reference(
 
 
 def serve_reelchart(project_dir: Path):
-    data_path = project_dir / "data" / "transcription" / "merged.csv"
-
-    try:
-        data = pd.read_csv(data_path)
-    except FileNotFoundError:
+    data = read_annotations(project_dir, "transcription")
+    if data.empty:
+        import analysis
         import utils
         print(
             "Speech Transcription data not found, running analysis on all downloaded videos..."
         )
         video_ids = [utils.parse_id(v.stem) for v in project_dir.glob("download/*.mp4")]
         analysis.batch_annotate_from_ids(video_ids, "transcription", project_dir)
-        data = pd.read_csv(data_path)
+        data = read_annotations(project_dir, "transcription")
 
     visualiser_name = "reelchart"
     reelchart_dest = copy_visualiser_dir(project_dir, visualiser_name)
@@ -0,0 +1,164 @@
+import collections
+import concurrent.futures
+import random
+import threading
+import time
+from typing import Callable, Iterable, Optional, Tuple, Type
+
+MEGABYTE = 1024 * 1024
+
+
+def retry_with_backoff(fn: Callable, *args, retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                       retry_on: Tuple[Type[Exception], ...] = (Exception,),
+                       on_retry: Optional[Callable[[Exception], None]] = None, **kwargs):
+    """
+    Calls fn, retrying on the given exceptions with exponential backoff and full jitter
+    :param retries: number of retries after the first attempt
+    :param base_delay: upper bound of the first delay in seconds, doubled at every retry
+    :param max_delay: upper bound of any delay in seconds
+    :param retry_on: exceptions that trigger a retry, anything else is raised straight away
+    :param on_retry: called with the exception before every retry
+    :return: the return value of fn
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except retry_on as e:
+            if attempt == retries:
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+class TokenBucket:
+    """Thread-safe bandwidth cap, consume blocks until the requested bytes fit in the budget"""
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None):
+        """
+        :param rate: bytes per second, None for no limit
+        :param burst: largest amount of bytes that can be consumed at once, defaults to one second worth
+        """
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        if self.rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class ThroughputMeter:
+    """Aggregate throughput over a sliding window"""
+
+    def __init__(self, window: float = 5.0):
+        self.window = window
+        self._samples = collections.deque()
+        self._lock = threading.Lock()
+
+    def add(self, amount: int) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), amount))
+
+    def rate(self) -> float:
+        """:return: bytes per second over the last window"""
+        with self._lock:
+            cutoff = time.monotonic() - self.window
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            return sum(amount for _, amount in self._samples) / self.window
+
+
+class AdaptiveScheduler:
+    """
+    Runs jobs on a thread pool whose concurrency follows the observed throughput: while adding a worker makes
+    the aggregate throughput grow, another one is added, when it stops helping the last one is removed, and
+    every error halves the concurrency. Transfers report their bytes through on_bytes, which also applies the
+    global bandwidth cap.
+    """
+
+    def __init__(self, min_workers: int = 1, max_workers: int = 32, initial_workers: int = 4,
+                 bandwidth_limit: Optional[float] = None, adjust_interval: float = 5.0):
+        """
+        :param bandwidth_limit: global cap in bytes per second, None for no limit
+        :param adjust_interval: seconds between concurrency adjustments
+        """
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.limit = initial_workers
+        self.adjust_interval = adjust_interval
+        self.bucket = TokenBucket(bandwidth_limit)
+        self.meter = ThroughputMeter(window=adjust_interval)
+        self._active = 0
+        self._slots = threading.Condition()
+        self._last_rate = 0.0
+        self._direction = 1
+        self._last_adjust = time.monotonic()
+
+    def on_bytes(self, amount: int) -> None:
+        self.bucket.consume(amount)
+        self.meter.add(amount)
+
+    def on_error(self, _error: Exception = None) -> None:
+        """Halves the concurrency, it then grows back one worker at a time"""
+        with self._slots:
+            self.limit = max(self.min_workers, self.limit // 2)
+            self._direction = 1
+            self._last_rate = 0.0
+
+    def adjust(self) -> None:
+        """
+        Hill-climbs the concurrency limit on aggregate throughput: keeps moving in the same direction while
+        throughput improves, turns around when it degrades and holds while it is stable. Called periodically by run
+        """
+        now = time.monotonic()
+        if now - self._last_adjust < self.adjust_interval:
+            return
+        self._last_adjust = now
+        rate = self.meter.rate()
+        with self._slots:
+            if rate > self._last_rate * 1.05:
+                step = self._direction
+            elif rate < self._last_rate * 0.95:
+                self._direction = -self._direction
+                step = self._direction
+            else:
+                step = 0
+            self.limit = min(self.max_workers, max(self.min_workers, self.limit + step))
+            self._last_rate = rate
+            self._slots.notify_all()
+
+    def _run_job(self, fn: Callable, *args):
+        with self._slots:
+            while self._active >= self.limit:
+                self._slots.wait()
+            self._active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._slots:
+                self._active -= 1
+                self._slots.notify()
+
+    def run(self, fn: Callable, jobs: Iterable[tuple]) -> Iterable[concurrent.futures.Future]:
+        """
+        Runs fn over every tuple of arguments in jobs
+        :return: futures, yielded as they complete
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(self._run_job, fn, *job) for job in jobs}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, timeout=1,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                self.adjust()
+                yield from done
@@ -0,0 +1,245 @@
+import math
+import os
+import subprocess
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import seconds_to_string, track_id
+
+SEGMENT_SECONDS = 600
+OVERLAP_SECONDS = 10
+# tracks of the same object seen by two consecutive segments are joined when their boxes overlap this much
+IOU_THRESHOLD = 0.5
+# largest time difference between the frames of two segments compared for the IoU
+FRAME_TOLERANCE = 0.1
+TIME_COLUMNS = {'start_sec': 'start', 'end_sec': 'end', 'time_sec': 'time'}
+
+
+class Segment(NamedTuple):
+    """
+    Part of a video cut for annotation. The file starts at `offset` in the original video, a keyframe, and extends
+    past both ends of the window it owns [own_start, own_end), so anything crossing the window edges is seen whole
+    """
+    index: int
+    path: Path
+    offset: float
+    own_start: float
+    own_end: float
+
+
+def keyframe_times(path: Path) -> Optional[np.ndarray]:
+    """
+    :return: timestamps of the keyframes of the video, only keyframes are decoded. None when the file has no video
+    stream, like an audio only proxy, which can be cut anywhere
+    """
+    output = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+                             '-show_entries', 'frame=pts_time', '-of', 'csv=p=0', path.as_posix()],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    times = [float(line) for line in output.stdout.decode().split() if line.replace('.', '', 1).isdigit()]
+    return np.array(sorted(times)) if times else None
+
+
+def plan_segments(duration: float, keyframes: Optional[np.ndarray], segment_seconds: float = SEGMENT_SECONDS,
+                  overlap_seconds: float = OVERLAP_SECONDS) -> List[Tuple[float, float, float, float]]:
+    """
+    :param duration: duration of the video in seconds
+    :param keyframes: sorted keyframe timestamps, segments start on one of them so they can be cut without
+    re-encoding. When None, segments start evenly spaced
+    :return: cut start, cut end and owned window of every segment
+    """
+    count = max(1, math.ceil(duration / segment_seconds))
+    plan = []
+    for i in range(count):
+        own_start = i * segment_seconds
+        own_end = min(duration, (i + 1) * segment_seconds)
+        wanted_start = max(0.0, own_start - overlap_seconds)
+        if keyframes is None:
+            cut_start = wanted_start
+        else:
+            cut_start = float(keyframes[max(0, np.searchsorted(keyframes, wanted_start, side='right') - 1)])
+        cut_end = min(duration, own_end + overlap_seconds)
+        # the first and last windows are open, nothing before the start or after the end gets dropped
+        plan.append((cut_start, cut_end, -math.inf if i == 0 else own_start,
+                     math.inf if i == count - 1 else own_end))
+    return plan
+
+
+def split_video(path: Path, out_dir: Path, duration: float, segment_seconds: float = SEGMENT_SECONDS,
+                overlap_seconds: float = OVERLAP_SECONDS) -> List[Segment]:
+    """
+    Cuts a video into overlapping, keyframe aligned segments with stream copy. Segments already cut are reused
+    :param path: video to split
+    :param out_dir: directory of the segments, named after the video so the id can still be parsed from them
+    :param duration: duration of the video in seconds
+    :return: segments of the video
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    segments = []
+    for i, (cut_start, cut_end, own_start, own_end) in enumerate(
+            plan_segments(duration, keyframe_times(path), segment_seconds, overlap_seconds)):
+        segment_path = out_dir / f'{path.stem}_segment{i:03d}{path.suffix}'
+        if not segment_path.is_file() or segment_path.stat().st_mtime < path.stat().st_mtime:
+            part_path = segment_path.with_name(f'{segment_path.stem}.part{segment_path.suffix}')
+            subprocess.run(['ffmpeg', '-y', '-v', 'error', '-ss', str(cut_start), '-i', path.as_posix(),
+                            '-t', str(cut_end - cut_start), '-map', '0', '-c', 'copy', '-avoid_negative_ts',
+                            'make_zero', part_path.as_posix()],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            os.replace(part_path, segment_path)
+        segments.append(Segment(i, segment_path, cut_start, own_start, own_end))
+    return segments
+
+
+def shift_times(data: pd.DataFrame, offset: float) -> pd.DataFrame:
+    """:return: copy of the annotations of a segment with times relative to the original video"""
+    data = data.copy()
+    for column in ['time_seconds', *TIME_COLUMNS]:
+        if column in data:
+            data[column] = data[column] + offset
+            if column in TIME_COLUMNS:
+                data[TIME_COLUMNS[column]] = [seconds_to_string(t) for t in data[column]]
+    return data
+
+
+def owned(data: pd.DataFrame, segment: Segment, column: str) -> pd.DataFrame:
+    """:return: rows of a segment whose time falls in the window the segment owns"""
+    return data[(data[column] >= segment.own_start) & (data[column] < segment.own_end)]
+
+
+def stitch_shots(parts: List[Tuple[Segment, pd.DataFrame]], video_id: str) -> pd.DataFrame:
+    """Shots are rebuilt from the shot changes found in each owned window"""
+    starts, end = [], 0.0
+    for segment, data in parts:
+        # the first shot of a later segment starts where the segment was cut, not at a shot change
+        data = data.iloc[1:] if segment.index > 0 else data
+        starts.extend(owned(data, segment, 'start_sec')['start_sec'])
+        end = max([end, *data['end_sec']])
+    starts = np.array(sorted(starts))
+    ends = np.append(starts[1:], end)
+    return pd.DataFrame({'id': video_id, 'shot_num': np.arange(len(starts)),
+                         'start': [seconds_to_string(t) for t in starts], 'end': [seconds_to_string(t) for t in ends],
+                         'start_sec': starts, 'end_sec': ends})
+
+
+def stitch_labels(parts: List[Tuple[Segment, pd.DataFrame]], video_id: str) -> pd.DataFrame:
+    """
+    Label segments are clipped to the owned windows, so a label crossing a window edge ends up in two abutting
+    pieces, which are joined back together
+    """
+    pieces = []
+    for segment, data in parts:
+        data = data.assign(start_sec=data['start_sec'].clip(lower=segment.own_start),
+                           end_sec=data['end_sec'].clip(upper=segment.own_end), segment=segment.index)
+        pieces.append(data[data['start_sec'] < data['end_sec']])
+    data = pd.concat(pieces, ignore_index=True).sort_values(['entity', 'start_sec'], kind='stable')
+
+    rows = []
+    for row in data.to_dict('records'):
+        last = rows[-1] if rows else None
+        if last is not None and last['entity'] == row['entity'] and last['segment'] == row['segment'] - 1 \
+                and last['end_sec'] == row['start_sec']:
+            last['end_sec'] = row['end_sec']
+            last['confidence'] = max(last['confidence'], row['confidence'])
+            last['segment'] = row['segment']
+        else:
+            rows.append(row)
+    data = pd.DataFrame(rows, columns=data.columns).drop(columns='segment')
+    data['start'] = [seconds_to_string(t) for t in data['start_sec']]
+    data['end'] = [seconds_to_string(t) for t in data['end_sec']]
+    return data.sort_values('start_sec', kind='stable').reset_index(drop=True)
+
+
+def stitch_frame_labels(parts: List[Tuple[Segment, pd.DataFrame]], video_id: str) -> pd.DataFrame:
+    """Frames are kept by owned window, then every entity gets a single id for the whole video"""
+    data = pd.concat([owned(data, segment, 'time_sec') for segment, data in parts], ignore_index=True)
+    taken = set()
+    ids = {entity: track_id(video_id, entity, i, taken) for i, entity in enumerate(data['entity'].unique())}
+    data['entity_id'] = data['entity'].map(ids)
+    return data
+
+
+def stitch_words(parts: List[Tuple[Segment, pd.DataFrame]], video_id: str) -> pd.DataFrame:
+    return pd.concat([owned(data, segment, 'start_sec') for segment, data in parts], ignore_index=True)
+
+
+def box_iou(a: pd.DataFrame, b: pd.DataFrame) -> np.ndarray:
+    """:return: intersection over union of the boxes in the rows of a and b, pairwise"""
+    width = (np.minimum(a['right'].to_numpy(), b['right'].to_numpy()) -
+             np.maximum(a['left'].to_numpy(), b['left'].to_numpy())).clip(0)
+    height = (np.minimum(a['bottom'].to_numpy(), b['bottom'].to_numpy()) -
+              np.maximum(a['top'].to_numpy(), b['top'].to_numpy())).clip(0)
+    intersection = width * height
+    area_a = (a['right'] - a['left']).to_numpy() * (a['bottom'] - a['top']).to_numpy()
+    area_b = (b['right'] - b['left']).to_numpy() * (b['bottom'] - b['top']).to_numpy()
+    union = area_a + area_b - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection, dtype=float), where=union > 0)
+
+
+def match_tracks(previous: pd.DataFrame, current: pd.DataFrame) -> Dict[str, str]:
+    """
+    Matches the tracks of a segment with the ones of the segment before, on the frames both of them saw
+    :return: id in the previous segment of every matched track of the current one
+    """
+    overlap_start, overlap_end = current['time_seconds'].min(), previous['time_seconds'].max()
+    before = previous[previous['time_seconds'] >= overlap_start - FRAME_TOLERANCE]
+    after = current[current['time_seconds'] <= overlap_end + FRAME_TOLERANCE]
+    pairs = after.merge(before, on='object_name', suffixes=('', '_previous'))
+    pairs = pairs[(pairs['time_seconds'] - pairs['time_seconds_previous']).abs() <= FRAME_TOLERANCE]
+    if pairs.empty:
+        return {}
+
+    previous_boxes = pairs[['left_previous', 'top_previous', 'right_previous', 'bottom_previous']]
+    previous_boxes.columns = ['left', 'top', 'right', 'bottom']
+    pairs = pairs.assign(iou=box_iou(pairs, previous_boxes))
+    scores = pairs.groupby(['object_id', 'object_id_previous'])['iou'].mean().sort_values(ascending=False)
+
+    matches, used = {}, set()
+    for (object_id, previous_id), score in scores.items():
+        if score < IOU_THRESHOLD:
+            break
+        if object_id not in matches and previous_id not in used:
+            matches[object_id] = previous_id
+            used.add(previous_id)
+    return matches
+
+
+def stitch_objects(parts: List[Tuple[Segment, pd.DataFrame]], video_id: str) -> pd.DataFrame:
+    """
+    Tracks get ids unique across segments, tracks continuing from the previous segment take over its id, then
+    frames are kept by owned window
+    """
+    taken, frames, previous = set(), [], None
+    for segment, data in parts:
+        ids = {object_id: track_id(video_id, object_id, segment.index, taken)
+               for object_id in data['object_id'].unique()}
+        data = data.assign(object_id=data['object_id'].map(ids))
+        if previous is not None and not data.empty and not previous.empty:
+            data['object_id'] = data['object_id'].replace(match_tracks(previous, data))
+        frames.append(owned(data, segment, 'time_seconds'))
+        previous = data
+    return pd.concat(frames, ignore_index=True)
+
+
+STITCHERS = {
+    'label_detection': stitch_labels,
+    'frame_label_detection': stitch_frame_labels,
+    'transcription': stitch_words,
+    'object_tracking': stitch_objects,
+    'shot_change_detection': stitch_shots,
+}
+
+
+def stitch_segments(video_id: str, segments: List[Segment],
+                    results: Dict[int, Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+    """
+    Joins the annotations of the segments of a video into annotations of the whole video
+    :param results: annotations of every segment, by segment index and feature
+    :return: annotations of the video, by feature
+    """
+    stitched = {}
+    for feature in results[segments[0].index]:
+        parts = [(segment, shift_times(results[segment.index][feature], segment.offset)) for segment in segments]
+        stitched[feature] = STITCHERS[feature](parts, video_id)
+    return stitched
@@ -0,0 +1,129 @@
+import concurrent.futures
+import subprocess
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from catalog import find_video_info
+from dataset import AnnotationDataset
+from utils import parse_id, seconds_to_string
+
+FRAME_WIDTH = 64
+FRAME_HEIGHT = 36
+HISTOGRAM_BINS = 32
+CHUNK_FRAMES = 256
+# half the L1 distance between the histograms of two frames, 0 for identical histograms and 1 for disjoint ones
+CUT_THRESHOLD = 0.35
+MIN_SHOT_SECONDS = 0.5
+DEFAULT_FPS = 25.0
+SHOT_COLUMNS = ['shot_num', 'start', 'end', 'start_sec', 'end_sec']
+
+
+def read_gray_frames(path: Path, width: int = FRAME_WIDTH, height: int = FRAME_HEIGHT,
+                     chunk: int = CHUNK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Decodes the video once, downscaled and in grayscale
+    :return: chunks of up to `chunk` frames, shaped (frames, height * width)
+    """
+    frame_size = width * height
+    command = ['ffmpeg', '-v', 'error', '-i', path.as_posix(), '-an', '-vf', f'scale={width}:{height},format=gray',
+               '-f', 'rawvideo', '-pix_fmt', 'gray', '-']
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        while True:
+            data = process.stdout.read(frame_size * chunk)
+            frames = len(data) // frame_size
+            if not frames:
+                break
+            yield np.frombuffer(data, np.uint8, count=frames * frame_size).reshape(frames, frame_size)
+
+
+def histograms(frames: np.ndarray, bins: int = HISTOGRAM_BINS) -> np.ndarray:
+    """:return: normalized grayscale histogram of every frame, computed with a single bincount"""
+    count = len(frames)
+    indexes = (frames.astype(np.int64) * bins >> 8) + np.arange(count)[:, None] * bins
+    return np.bincount(indexes.ravel(), minlength=count * bins).reshape(count, bins) / frames.shape[1]
+
+
+def frame_distances(chunks: Iterable[np.ndarray]) -> np.ndarray:
+    """:return: histogram distance between every frame and the one before it, 0 for the first frame"""
+    distances = []
+    previous = None
+    for chunk in chunks:
+        current = histograms(chunk)
+        stacked = np.vstack([current[:1] if previous is None else previous, current])
+        distances.append(0.5 * np.abs(np.diff(stacked, axis=0)).sum(axis=1))
+        previous = current[-1:]
+    return np.concatenate(distances) if distances else np.empty(0)
+
+
+def shot_starts(distances: np.ndarray, fps: float, threshold: float = CUT_THRESHOLD,
+                min_shot_seconds: float = MIN_SHOT_SECONDS) -> List[int]:
+    """:return: first frame of every shot, cuts closer than min_shot_seconds to the previous one are ignored"""
+    min_frames = max(1, round(min_shot_seconds * fps))
+    starts = [0]
+    for frame in np.flatnonzero(distances > threshold):
+        if frame - starts[-1] >= min_frames:
+            starts.append(int(frame))
+    return starts
+
+
+def detect_shots(path: Path, threshold: float = CUT_THRESHOLD,
+                 min_shot_seconds: float = MIN_SHOT_SECONDS) -> pd.DataFrame:
+    """
+    Finds the shots of a video locally, with the same columns as parse_shot_change_data
+    :param path: path of the video
+    :param threshold: histogram distance above which two consecutive frames are a cut
+    :param min_shot_seconds: shortest shot that can be detected
+    :return: dataframe of shots
+    """
+    fps = find_video_info(path)['fps'] or DEFAULT_FPS
+    distances = frame_distances(read_gray_frames(path))
+    if not len(distances):
+        return pd.DataFrame(columns=SHOT_COLUMNS)
+
+    bounds = np.array(shot_starts(distances, fps, threshold, min_shot_seconds) + [len(distances)])
+    start_sec = bounds[:-1] / fps
+    end_sec = (bounds[1:] - 1) / fps
+    return pd.DataFrame({'shot_num': np.arange(len(start_sec)),
+                         'start': [seconds_to_string(t) for t in start_sec],
+                         'end': [seconds_to_string(t) for t in end_sec],
+                         'start_sec': start_sec, 'end_sec': end_sec})
+
+
+def batch_detect_shots(ids: List[str], project_directory: Path, max_workers: Optional[int] = None,
+                       threshold: float = CUT_THRESHOLD) -> pd.DataFrame:
+    """
+    Detects the shots of the downloaded videos on a process pool, without uploading them. Results go to the
+    shot_change_detection dataset, like the ones of the Video Intelligence API, and videos already in it are skipped
+    :param ids: list of ids to analyse
+    :param project_directory: main directory of the project
+    :param max_workers: number of processes, defaults to the number of CPUs
+    :param threshold: histogram distance above which two consecutive frames are a cut
+    :return: dataframe with the shots of all the videos
+    """
+    dataset = AnnotationDataset(project_directory / 'data' / 'shot_change_detection')
+    dataset.directory.mkdir(parents=True, exist_ok=True)
+    video_files = [path for path in (project_directory / 'download').glob('*.mp4')
+                   if parse_id(path.as_posix()) in ids and not dataset.has(parse_id(path.stem))]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(detect_shots, path, threshold): path for path in video_files}
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures),
+                           desc=f"Detecting shots locally for videos in {Path(project_directory).name}"):
+            path = futures[future]
+            try:
+                data = future.result()
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"Error detecting shots in {path.name}: {e}")
+                continue
+            if data.empty:
+                # nothing could be decoded, not recorded so the video is tried again on the next run
+                print(f"No frames decoded from {path.name}, skipping it")
+                continue
+            data.insert(0, 'id', parse_id(path.stem))
+            dataset.write(parse_id(path.stem), path.stem, data)
+
+    return dataset.read(ids)
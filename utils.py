@@ -1,10 +1,12 @@
+import hashlib
 import os
 import re
 import subprocess
 from functools import reduce
 from pathlib import Path
+from typing import List
 import string
-import numpy as np
+from catalog import get_catalog
 import socket
 import webbrowser
 import http.server
@@ -79,14 +81,51 @@ def find_video_by_id(video_id: str, in_dir: Path) -> Path:
     :param in_dir: directory to search in
     :return: video filename
     """
-    return next(file_path for file_path in in_dir.glob('*.mp4') if video_id in file_path.name)
+    return get_catalog(in_dir).path(video_id)
 
 
 def find_longest_video(in_dir: Path) -> Path:
-    durations = np.array([float(subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of',
-                                                'default=noprint_wrappers=1:nokey=1', video.as_posix()],
-                                               stdout=subprocess.PIPE).stdout) for video in in_dir.glob('*.mp4')])
-    return list(in_dir.glob('*.mp4'))[durations.argmax()]
+    videos = get_catalog(in_dir).all_info()
+    return in_dir / max(videos, key=lambda video: video['duration'])['path']
+
+
+def chunks(items: list, size: int) -> List[list]:
+    """Split a list into consecutive chunks of at most `size` items"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def is_valid_video(path: Path) -> bool:
+    """Checks that ffprobe can read the container and find a duration"""
+    probe = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of',
+                            'default=noprint_wrappers=1:nokey=1', path.as_posix()],
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        return probe.returncode == 0 and float(probe.stdout) > 0
+    except ValueError:
+        return False
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def track_id(video_id: str, entity: str, index: int, taken: set) -> str:
+    """
+    Short id of an object track or frame label, derived from the video, the entity and the position of the track
+    in the results, so that parsing the same results again gives the same ids
+    :param taken: ids already given to the other tracks of the video, updated in place
+    """
+    key = f'{video_id}:{entity}:{index}'
+    short_id = hashlib.sha1(key.encode()).hexdigest()[:8]
+    while short_id in taken:
+        key += '+'
+        short_id = hashlib.sha1(key.encode()).hexdigest()[:8]
+    taken.add(short_id)
+    return short_id
 
 
 def ensure_even(n: int):
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+from tqdm import tqdm
+
+from api_cache import get_api_cache
+from utils import chunks
+
+API_URL = 'https://www.googleapis.com/youtube/v3'
+REQUESTS_PER_SECOND = 20
+MAX_CONNECTIONS = 16
+PAGE_SIZE = 50
+PLAYLIST_FIELDS = "etag,nextPageToken,pageInfo,items/contentDetails/videoId"
+SEARCH_FIELDS = "etag,items(id/channelId,snippet/title)"
+
+
+class RateLimiter:
+    """Spaces out requests so that no more than `rate` of them start in any second, across all tasks"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AsyncYouTubeClient:
+    """
+    Minimal asyncio client for the YouTube Data API. All requests go through one pooled aiohttp session,
+    share a global requests-per-second limit and are served from the API cache when possible.
+    Use as an async context manager.
+    """
+
+    def __init__(self, api_key: str, requests_per_second: float = REQUESTS_PER_SECOND,
+                 max_connections: int = MAX_CONNECTIONS):
+        self.api_key = api_key.strip()
+        self.max_connections = max_connections
+        self.limiter = RateLimiter(requests_per_second)
+        self.cache = get_api_cache()
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections),
+                                              timeout=aiohttp.ClientTimeout(total=60))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def request(self, resource: str, **params) -> dict:
+        await self.limiter.wait()
+        params = {key: value for key, value in params.items() if value is not None}
+        async with self._session.get(f'{API_URL}/{resource}', params={**params, 'key': self.api_key}) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def request_cached(self, resource: str, key: str, ttl_key: str, **params) -> dict:
+        """
+        Same as request, but served from the API cache while fresh. Expired responses are revalidated with their
+        ETag, so an unchanged response is not transferred again
+        """
+        body, etag, fresh = self.cache.get_response(key, ttl_key)
+        if fresh:
+            return body
+        await self.limiter.wait()
+        params = {key: value for key, value in params.items() if value is not None}
+        headers = {'If-None-Match': etag} if etag else {}
+        async with self._session.get(f'{API_URL}/{resource}', params={**params, 'key': self.api_key},
+                                     headers=headers) as response:
+            if response.status == 304:
+                self.cache.touch_response(key)
+                return body
+            response.raise_for_status()
+            body = await response.json()
+        self.cache.put_response(key, body)
+        return body
+
+    async def playlist_page(self, playlist_id: str, page_token: Optional[str]) -> dict:
+        return await self.request_cached('playlistItems', f'playlistItems:{playlist_id}:{page_token}', 'playlistItems',
+                                         part='contentDetails', playlistId=playlist_id, maxResults=PAGE_SIZE,
+                                         pageToken=page_token, fields=PLAYLIST_FIELDS)
+
+    async def playlist_video_ids(self, playlist_id: str) -> List[str]:
+        """
+        Pages through a playlist. The next page is requested as soon as its token is known, before the current
+        page is parsed
+        :param playlist_id: id of the playlist, must be public
+        :return: list of video ids
+        """
+        ids = []
+        page = asyncio.ensure_future(self.playlist_page(playlist_id, None))
+        while page is not None:
+            result = await page
+            page_token = result.get('nextPageToken')
+            page = asyncio.ensure_future(self.playlist_page(playlist_id, page_token)) if page_token else None
+            ids.extend(item['contentDetails']['videoId'] for item in result.get('items', []))
+        return ids
+
+    async def uploads_playlist_ids(self, channel_ids: List[str]) -> Dict[str, str]:
+        """
+        :param channel_ids: list of channel ids
+        :return: uploads playlist id for each channel found
+        """
+        items, stale = self.cache.get_parts('channels', channel_ids, ['contentDetails'])
+        for page in chunks(list(stale), PAGE_SIZE):
+            response = await self.request('channels', part='contentDetails', id=','.join(page), maxResults=PAGE_SIZE,
+                                          fields='items(id,etag,contentDetails)')
+            for item in response.get('items', []):
+                self.cache.put_item('channels', item, ['contentDetails'])
+                items[item['id']] = item
+        return {channel_id: item['contentDetails']['relatedPlaylists']['uploads']
+                for channel_id, item in items.items() if 'contentDetails' in item}
+
+    async def search_channels(self, query: str) -> List[dict]:
+        """
+        :param query: channel name
+        :return: channel search results, only carrying channel id and title
+        """
+        response = await self.request_cached('search', f'search:channel:{query}', 'search',
+                                             part='snippet', q=query, type='channel', fields=SEARCH_FIELDS)
+        return response['items']
+
+
+async def _crawl(client: AsyncYouTubeClient, playlists: Dict[str, str], desc: str) -> Dict[str, List[str]]:
+    """
+    Crawls many playlists at once
+    :param playlists: maps the key to return results under to the playlist to crawl
+    :return: video ids for each key
+    """
+    async def crawl_one(key, playlist_id):
+        try:
+            return key, await client.playlist_video_ids(playlist_id)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error crawling playlist {playlist_id}: {e!r}")
+            return key, []
+
+    results = {}
+    tasks = [crawl_one(key, playlist_id) for key, playlist_id in playlists.items()]
+    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=desc):
+        key, ids = await task
+        results[key] = ids
+    return results
+
+
+async def crawl_playlists(api_key: str, playlist_ids: List[str]) -> Dict[str, List[str]]:
+    """
+    :param api_key: YouTube Data API key
+    :param playlist_ids: ids of public playlists
+    :return: video ids of each playlist
+    """
+    async with AsyncYouTubeClient(api_key) as client:
+        return await _crawl(client, {playlist_id: playlist_id for playlist_id in playlist_ids}, "Crawling playlists")
+
+
+async def crawl_channels(api_key: str, channel_ids: List[str]) -> Dict[str, List[str]]:
+    """
+    :param api_key: YouTube Data API key
+    :param channel_ids: ids of public channels
+    :return: ids of the videos uploaded by each channel
+    """
+    async with AsyncYouTubeClient(api_key) as client:
+        uploads = await client.uploads_playlist_ids(channel_ids)
+        return await _crawl(client, uploads, "Crawling channels")
+
+
+async def search_channels(api_key: str, query: str) -> List[dict]:
+    async with AsyncYouTubeClient(api_key) as client:
+        return await client.search_channels(query)